@@ -0,0 +1,220 @@
+#Batched perception for offline map reconstruction.
+#perception_step handles one image and one pose at a time. Rebuilding a map from thousands of
+#recorded frames instead goes through these functions, which take a stack of frames with their
+#(x, y, yaw) poses and classify, project and scatter the whole stack in vectorized passes:
+#
+#  classify_window: only the camera pixels that can reach the map are classified, for all the
+#                   frames at once
+#  frames_to_world: the pixels of every frame are projected to world cells with that frame's pose
+#  frames_rocks:    the few frames with rock pixels in view are grouped into rock objects
+#  scatter_frames:  the hits of all the frames are added to an OccupancyGrid at once
+#
+#The map they build is exactly the one perception_step builds frame by frame (see
+#scatter_frames for how the order dependent cell states are replayed).
+#
+#usage (from the code directory): python batch_perception.py <recording> [--limit N] [--batch-size N]
+#checks the batched map against the frame by frame one and compares their throughput
+import argparse
+import base64
+import time
+
+import numpy as np
+
+from calibration import CameraCalibration
+from mapping import OccupancyGrid, MAX_HITS, OBSTACLE_CELL, NAVIGABLE_CELL, cells_of
+from perception import NAVIGABLE, OBSTACLE, ROCK, classify_pixels
+from rock_detection import detect_rocks
+from workspace import FrameWorkspace
+from world_transform import WorldTransform
+
+#The pixels the batched perception works on: the top down pixels inside the terrain or rock
+#windows (the only ones that reach the map) and the distinct camera pixels they are sampled from.
+#Returns the window pixel indices into the calibration tables, the (full image) camera pixel flat indices and,
+#for each window pixel, the index of its camera pixel in that list
+def window_samples(calibration):
+    window_index = np.flatnonzero(calibration.terrain_window | calibration.rock_window)
+    pixels, inverse = np.unique(calibration.camera_index[window_index], return_inverse=True)
+    return window_index, pixels, inverse
+
+#Classify the window pixels of a (n_frames, height, width, 3) stack of RGB frames. Only the camera
+#pixels the windows sample from are classified, all of the frames' samples as one image (the color
+#conversions and thresholds are per pixel, so the labels are the same as perception.classify_pixels
+#gives for the whole frame). Returns the (n_frames, window pixels) NAVIGABLE/OBSTACLE/ROCK flags
+def classify_window(frames, samples, pixels_to_cut=60, **thresholds):
+    _, pixels, inverse = samples
+    n_frames, img_h, img_w = frames.shape[:3]
+    colors = frames.reshape(n_frames, img_h * img_w, 3)[:, pixels]
+    labels = classify_pixels(colors.reshape(-1, 1, 3), pixels_to_cut=0, **thresholds).reshape(n_frames, len(pixels))
+    #navigable terrain and rocks never come from the sky
+    in_sky = pixels // img_w < pixels_to_cut
+    if in_sky.any():
+        sky = labels[:, in_sky]
+        sky[(sky & NAVIGABLE) > 0] = 0
+        sky &= ~np.uint8(ROCK)
+        labels[:, in_sky] = sky
+    return labels[:, inverse]
+
+#Project the window flags of a stack of frames to world cells. poses is an (n_frames, 3) array of
+#the rover (x, y, yaw) of each frame. Returns the navigable terrain and obstacles as
+#(frame index, x world, y world) triples of arrays, with the same windows and rounding as
+#perception.get_world_coordinates
+def frames_to_world(flags, poses, calibration, samples, world_size, scale):
+    window_index = samples[0]
+    rover_xy_window = calibration.rover_xy[window_index]
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+    #the same per frame world transforms as perception.get_world_coordinates
+    transforms = [WorldTransform(x, y, yaw, scale, world_size) for x, y, yaw in poses]
+
+    results = []
+    for flag, window in ((NAVIGABLE, calibration.terrain_window),
+                         (OBSTACLE, calibration.terrain_window)):
+        frame_index, pixel_index = np.nonzero(((flags & flag) > 0) & window[window_index])
+        rover_xy = rover_xy_window[pixel_index]
+        world_xy = np.empty((len(pixel_index), 2), dtype=np.int_)
+        #the pixels come out of np.nonzero grouped by frame
+        bounds = np.searchsorted(frame_index, np.arange(len(poses) + 1))
+        for transform, start, end in zip(transforms, bounds[:-1], bounds[1:]):
+            transform.apply(rover_xy[start:end], out=world_xy[start:end])
+        results.append((frame_index, world_xy[:, 0], world_xy[:, 1]))
+
+    navigable, obstacles = results
+    return navigable, obstacles
+
+#The rocks of a stack of frames as (frame index, x world, y world) arrays, one cell per rock as
+#perception_step flags them. Rocks need the connected blobs of the whole region of interest rock
+#mask, which classify_window does not compute, so only the frames with rock pixels inside the rock
+#window are classified in full (through workspace, a FrameWorkspace of the calibration) and
+#grouped with rock_detection.detect_rocks. Those are few: rocks are rarely in view
+def frames_rocks(frames, flags, poses, calibration, workspace, world_size, scale):
+    roi = calibration.roi
+    rock_flags = ((flags & ROCK) > 0) & workspace.window_rock
+    frame_index = []
+    rocks = []
+    for frame in np.flatnonzero(rock_flags.any(axis=1)):
+        classify_pixels(roi.view(frames[frame]), pixels_to_cut=roi.rows_to_cut(60), workspace=workspace)
+        transform = WorldTransform(*poses[frame], scale, world_size)
+        frame_rocks = detect_rocks(workspace.rocks, np.flatnonzero(rock_flags[frame]), workspace, transform)
+        frame_index += [frame] * len(frame_rocks)
+        rocks += frame_rocks
+    return (np.int_(frame_index), np.int_([rock.x_world for rock in rocks]),
+            np.int_([rock.y_world for rock in rocks]))
+
+#Add the hits of n_frames frames of world cells (see frames_to_world) to an OccupancyGrid, giving
+#the grid the same counts, states and rocks as calling its update() frame by frame.
+#Counts are plain (saturating) sums. A cell's state however depends on the order of the frames:
+#each frame recolors the cells it touched from their counts so far, ties leave a cell as it was
+#and cells stop being recolored once a rock has been seen in them. So the cumulative counts of
+#every cell are computed at each frame that touched it, and the cell gets the verdict of the last
+#of those frames that was not a tie and came before (or with) the first rock seen in it.
+#Returns the sorted flat indices of the cells touched or flagged as rocks.
+def scatter_frames(grid, obstacles, navigable, rocks, n_frames):
+    world_size = grid.world_size
+
+    #per (cell, frame) hits, ordered by cell then frame
+    obstacle_keys, obstacle_hits = np.unique(cells_of(obstacles[1], obstacles[2], world_size) * n_frames + obstacles[0], return_counts=True)
+    navigable_keys, navigable_hits = np.unique(cells_of(navigable[1], navigable[2], world_size) * n_frames + navigable[0], return_counts=True)
+    keys = np.union1d(obstacle_keys, navigable_keys)
+    hits = np.zeros((len(keys), 2), dtype=np.int64)
+    hits[np.searchsorted(keys, obstacle_keys), 0] = obstacle_hits
+    hits[np.searchsorted(keys, navigable_keys), 1] = navigable_hits
+    cells = keys // n_frames
+    frames = keys % n_frames
+    rock_cells = cells_of(rocks[1], rocks[2], world_size)
+    if not len(keys):
+        grid.set_rocks(rock_cells)
+        return np.unique(rock_cells)
+
+    #cumulative counts of each cell after each frame that touched it
+    first = np.r_[True, cells[1:] != cells[:-1]]
+    last = np.r_[first[1:], True]
+    group = np.cumsum(first) - 1
+    starts = np.flatnonzero(first)
+    cumulative = np.cumsum(hits, axis=0)
+    cumulative -= (cumulative[starts] - hits[starts])[group]
+    cumulative += grid.counts[cells]
+    np.minimum(cumulative, MAX_HITS, out=cumulative)
+
+    #the first frame a rock was seen in each cell (-1 for the cells that already were rocks)
+    rock_order = np.lexsort((rocks[0], rock_cells))
+    rock_cells, rock_first = np.unique(rock_cells[rock_order], return_index=True)
+    rock_first = rocks[0][rock_order][rock_first]
+    first_rock = np.full(len(cells), n_frames)
+    if len(rock_cells):
+        at = np.minimum(np.searchsorted(rock_cells, cells), len(rock_cells) - 1)
+        has_rock = rock_cells[at] == cells
+        first_rock[has_rock] = rock_first[at[has_rock]]
+    first_rock[grid.is_rock(cells)] = -1
+
+    #the last deciding frame of each cell sets its state
+    deciding = np.flatnonzero((frames <= first_rock) & (cumulative[:, 0] != cumulative[:, 1]))
+    deciding = deciding[np.r_[cells[deciding][1:] != cells[deciding][:-1], True]]
+    grid.state[cells[deciding]] = np.where(cumulative[deciding, 0] > cumulative[deciding, 1], OBSTACLE_CELL, NAVIGABLE_CELL)
+
+    grid.counts[cells[last]] = cumulative[last]
+    grid.set_rocks(rock_cells)
+    return np.union1d(cells[last], rock_cells)
+
+#Run the batched perception over a stack of frames and their (x, y, yaw) poses, updating grid
+#(an OccupancyGrid) and, if given, its MapStatistics. Frames are processed batch_size at a time
+#to bound the memory used. Returns the grid.
+def perceive_frames(frames, poses, grid, calibration=None, map_stats=None, scale=10, batch_size=64):
+    calibration = calibration or CameraCalibration(np.shape(frames)[1:3])
+    samples = window_samples(calibration)
+    workspace = FrameWorkspace(calibration.roi_shape, calibration)
+    for start in range(0, len(frames), batch_size):
+        batch = np.asarray(frames[start:start+batch_size])
+        batch_poses = np.asarray(poses[start:start+batch_size], dtype=np.float64).reshape(-1, 3)
+        flags = classify_window(batch, samples)
+        navigable, obstacles = frames_to_world(flags, batch_poses, calibration, samples, grid.world_size, scale)
+        rocks = frames_rocks(batch, flags, batch_poses, calibration, workspace, grid.world_size, scale)
+        changed_cells = scatter_frames(grid, obstacles, navigable, rocks, len(batch))
+        if map_stats is not None:
+            map_stats.update(grid, changed_cells)
+    return grid
+
+#The decoded frames and (x, y, yaw) poses of (telemetry, jpeg bytes) records, skipping the frames
+#with invalid telemetry that perception_step is not run on
+def decode_records(records):
+    from supporting_functions import decode_frame, parse_telemetry_floats
+    images = []
+    poses = []
+    for telemetry, jpeg in records:
+        pos, vel, yaw = parse_telemetry_floats(telemetry)[:3]
+        if not np.isfinite(vel):
+            continue
+        images.append(decode_frame(jpeg, None))
+        poses.append((pos[0], pos[1], yaw))
+    return np.array(images), np.array(poses)
+
+if __name__ == '__main__':
+    from perception import perception_step
+    from replay import load_frames
+    from rover_state import RoverState
+
+    parser = argparse.ArgumentParser(description='Batched map reconstruction check and benchmark')
+    parser.add_argument('recording', help='.rrec recording, a folder holding run.rrec, or a training mode folder')
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N frames')
+    parser.add_argument('--batch-size', type=int, default=64, help='Frames per vectorized pass')
+    args = parser.parse_args()
+
+    frames = list(load_frames(args.recording))[:args.limit]
+    images, poses = decode_records((data, base64.b64decode(data['image'])) for data, _ in frames)
+
+    #frame by frame
+    Rover = RoverState()
+    start = time.perf_counter()
+    for img, (x, y, yaw) in zip(images, poses):
+        Rover.img, Rover.pos, Rover.yaw = img, [x, y], yaw
+        perception_step(Rover)
+    sequential = time.perf_counter() - start
+
+    #batched
+    grid = OccupancyGrid(Rover.world_size)
+    start = time.perf_counter()
+    perceive_frames(images, poses, grid, Rover.calibration, batch_size=args.batch_size)
+    batched = time.perf_counter() - start
+
+    same = np.array_equal(grid.render(), Rover.occupancy.render())
+    print('{} frames: frame by frame {:.1f} frames/sec, batched {:.1f} frames/sec ({:.2f}x)'.format(
+        len(images), len(images) / sequential, len(images) / batched, sequential / batched))
+    print('maps are {}'.format('identical' if same else 'DIFFERENT'))
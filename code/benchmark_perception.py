@@ -0,0 +1,172 @@
+#Perception micro-benchmark suite.
+#Times each perception function, and the full perception_step, over the calibration images plus
+#synthetic frames (see synthetic_frames.py). Reports per-function latency distributions, the
+#peak and retained memory of a call and the memory blocks it allocates (traced with tracemalloc),
+#and saves machine readable results
+#so a change can be compared against a baseline run:
+#
+#  python benchmark_perception.py --output baseline.json
+#  ...make a change...
+#  python benchmark_perception.py --baseline baseline.json
+#
+#usage (from the code directory): python benchmark_perception.py [--repeat N] [--synthetic N]
+#       [--only NAME ...] [--output results.json] [--baseline baseline.json]
+import argparse
+import glob
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+import perception
+from calibration import CameraCalibration
+from rover_state import RoverState
+from synthetic_frames import FrameSynthesizer
+
+#a fixed pose, well inside the 200 x 200 world
+POSE = (100.3, 85.7, 37.0)
+WORLD_SIZE = 200
+SCALE = 10
+
+#the frames to benchmark on: the calibration images and `synthetic` synthetic frames
+def load_frames(synthetic, seed=0):
+    image_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'calibration_images')
+    frames = [(os.path.basename(image_path), np.asarray(Image.open(image_path)))
+              for image_path in sorted(glob.glob(os.path.join(image_dir, '*.jpg')))]
+    synthesizer = FrameSynthesizer(seed=seed)
+    for idx in range(synthetic):
+        frames.append(('synthetic_{}'.format(idx), synthesizer.render(*synthesizer.random_pose())[0]))
+    return frames
+
+#The benchmark cases: name -> function building a zero argument callable for a frame.
+#Inputs of the intermediate functions are computed outside of the timed call.
+def make_cases(calibration):
+    source, destination = calibration.source, calibration.destination
+    xpos, ypos, yaw = POSE
+
+    def warped(img):
+        return perception.perspect_transform(perception.bw_thresh(img), source, destination)[:,:,0]
+
+    def perspect_transform(img):
+        threshed = perception.bw_thresh(img)
+        return lambda: perception.perspect_transform(threshed, source, destination)
+
+    def rover_coords(img):
+        top_down = warped(img)
+        return lambda: perception.rover_coords(top_down)
+
+    def to_polar_coords(img):
+        xpix, ypix = perception.rover_coords(warped(img))
+        return lambda: perception.to_polar_coords(xpix, ypix)
+
+    def pix_to_world(img):
+        xpix, ypix = perception.rover_coords(warped(img))
+        return lambda: perception.pix_to_world(xpix, ypix, xpos, ypos, yaw, WORLD_SIZE, SCALE)
+
+    def perception_step(img):
+        Rover = RoverState()
+        Rover.pos, Rover.yaw, Rover.img = [xpos, ypos], yaw, img
+        return lambda: perception.perception_step(Rover)
+
+    world_args = (source, destination, xpos, ypos, yaw, WORLD_SIZE, SCALE)
+    return {
+        'bw_thresh': lambda img: lambda: perception.bw_thresh(img),
+        'rock_thresh': lambda img: lambda: perception.rock_thresh(img),
+        'perspect_transform': perspect_transform,
+        'rover_coords': rover_coords,
+        'to_polar_coords': to_polar_coords,
+        'pix_to_world': pix_to_world,
+        'get_navigible_terrain_world_coordinates': lambda img: lambda: perception.get_navigible_terrain_world_coordinates(img, *world_args),
+        'get_rock_world_coordinates': lambda img: lambda: perception.get_rock_world_coordinates(img, *world_args),
+        'get_obstacle_world_coordinates': lambda img: lambda: perception.get_obstacle_world_coordinates(img, *world_args),
+        'classify_pixels': lambda img: lambda: perception.classify_pixels(img),
+        'get_world_coordinates': lambda img: lambda: perception.get_world_coordinates(img, calibration, xpos, ypos, yaw, WORLD_SIZE, SCALE),
+        'perception_step': perception_step,
+    }
+
+#tracemalloc's own allocations (the snapshots) are left out of the block counts
+SNAPSHOT_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+#Peak and retained traced memory (bytes) of one call, and the number of memory blocks it
+#allocated that are still live when it returns (its result, and anything it caches), from the
+#block counts of tracemalloc snapshots taken around it. Blocks allocated and freed again inside
+#the call only show in the peak
+def measure_memory(call):
+    tracemalloc.start()
+    try:
+        before_blocks = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = call()
+        current, peak = tracemalloc.get_traced_memory()
+        after_blocks = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        del result
+    finally:
+        tracemalloc.stop()
+    blocks = sum(max(stat.count_diff, 0) for stat in after_blocks.compare_to(before_blocks, 'filename'))
+    return peak - before, current - before, blocks
+
+def run_case(build, frames, repeat):
+    times = []
+    peaks = []
+    retained = []
+    allocations = []
+    for _, img in frames:
+        call = build(img)
+        call() #warm up
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - start)
+        peak, kept, blocks = measure_memory(build(img))
+        peaks.append(peak)
+        retained.append(kept)
+        allocations.append(blocks)
+    us = 1e6 * np.array(times)
+    return {'calls': len(us), 'mean_us': float(us.mean()), 'min_us': float(us.min()),
+            'p50_us': float(np.percentile(us, 50)), 'p90_us': float(np.percentile(us, 90)),
+            'p99_us': float(np.percentile(us, 99)), 'max_us': float(us.max()),
+            'peak_kb': float(np.mean(peaks)) / 1024, 'retained_kb': float(np.mean(retained)) / 1024,
+            'allocations': float(np.mean(allocations))}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Perception micro-benchmarks')
+    parser.add_argument('--repeat', type=int, default=50, help='Timed calls per frame')
+    parser.add_argument('--synthetic', type=int, default=5, help='Number of synthetic frames')
+    parser.add_argument('--only', nargs='+', default=None, help='Only run these benchmarks')
+    parser.add_argument('--output', default=None, help='Write the results to this JSON file')
+    parser.add_argument('--baseline', default=None, help='Compare against the results in this JSON file')
+    args = parser.parse_args()
+
+    frames = load_frames(args.synthetic)
+    cases = make_cases(CameraCalibration())
+    names = args.only or list(cases)
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+    results = {}
+    print('{:42s} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s}{}'.format(
+        'benchmark', 'mean us', 'p50 us', 'p99 us', 'peak KB', 'kept KB', 'allocs', '  vs baseline' if baseline else ''))
+    for name in names:
+        results[name] = run_case(cases[name], frames, args.repeat)
+        result = results[name]
+        comparison = ''
+        if baseline is not None and name in baseline:
+            comparison = '  {:6.2f}x time {:6.2f}x peak'.format(
+                result['mean_us'] / baseline[name]['mean_us'],
+                result['peak_kb'] / baseline[name]['peak_kb'] if baseline[name]['peak_kb'] else float('nan'))
+        print('{:42s} {:9.1f} {:9.1f} {:9.1f} {:9.1f} {:9.1f} {:9.1f}{}'.format(
+            name, result['mean_us'], result['p50_us'], result['p99_us'], result['peak_kb'], result['retained_kb'],
+            result['allocations'], comparison))
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump({'frames': [name for name, _ in frames], 'repeat': args.repeat,
+                       'numpy': np.__version__, 'python': platform.python_version(),
+                       'results': results}, output_file, indent=2)
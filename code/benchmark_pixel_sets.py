@@ -0,0 +1,71 @@
+#Regression benchmark for the compacted pixel sets carried by the perception step.
+#Navigable terrain and obstacle pixels outside of the 80 px / 30 deg window used to be kept
+#at (0, 0); they now get dropped. This script runs both representations over the calibration
+#images and reports the array sizes, the per-frame cost of projecting them into the world
+#map, and the number of phantom hits that used to land on the rover's own cell.
+#
+#usage (from the code directory): python benchmark_pixel_sets.py [--repeat N]
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from calibration import CameraCalibration
+from perception import classify_pixels, pix_to_world, NAVIGABLE, OBSTACLE
+
+#the old representation: every visible pixel of the label, out of window pixels zeroed
+def zeroed_pixel_set(flags, label, calibration):
+    mask = (flags & label) > 0
+    window = calibration.terrain_window[mask]
+    xpix = np.where(window, calibration.xpix[mask], 0)
+    ypix = np.where(window, calibration.ypix[mask], 0)
+    dist = np.where(window, calibration.dist[mask], 0)
+    angles = np.where(window, calibration.angles[mask], 0)
+    return xpix, ypix, dist, angles
+
+#the current representation: only the pixels within the window
+def compact_pixel_set(flags, label, calibration):
+    mask = ((flags & label) > 0) & calibration.terrain_window
+    return calibration.xpix[mask], calibration.ypix[mask], calibration.dist[mask], calibration.angles[mask]
+
+#project a frame worth of navigable and obstacle pixel sets into a count map
+def map_frame(pixel_sets, map_count, xpos, ypos, yaw):
+    for channel, (xpix, ypix, dist, angles) in enumerate(pixel_sets):
+        x_world, y_world = pix_to_world(xpix, ypix, xpos, ypos, yaw, map_count.shape[0], 10)
+        map_count[y_world, x_world, channel] += 1
+
+def run(images, calibration, pixel_set, repeat):
+    xpos, ypos, yaw = 100.0, 100.0, 0.0
+    map_count = np.zeros((200, 200, 2))
+    sizes = []
+    phantom = 0
+    times = []
+    for _ in range(repeat):
+        for img in images:
+            start = time.perf_counter()
+            roi = calibration.roi
+            flags = calibration.gather(classify_pixels(roi.view(img), pixels_to_cut=roi.rows_to_cut(60)))
+            sets = [pixel_set(flags, label, calibration) for label in (OBSTACLE, NAVIGABLE)]
+            map_frame(sets, map_count, xpos, ypos, yaw)
+            times.append(time.perf_counter() - start)
+            sizes.append(sum(len(s[0]) for s in sets))
+            phantom += sum(int(np.count_nonzero((s[0] == 0) & (s[1] == 0))) for s in sets)
+    return np.mean(sizes), phantom / len(sizes), np.array(times)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compacted pixel set benchmark')
+    parser.add_argument('--repeat', type=int, default=50, help='Passes over the calibration images')
+    args = parser.parse_args()
+
+    image_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'calibration_images')
+    images = [np.asarray(Image.open(f)) for f in sorted(glob.glob(os.path.join(image_dir, '*.jpg')))]
+    calibration = CameraCalibration()
+
+    for name, pixel_set in (('zeroed', zeroed_pixel_set), ('compact', compact_pixel_set)):
+        size, phantom, times = run(images, calibration, pixel_set, args.repeat)
+        print('{:8s} pixels/frame: {:8.0f}  phantom hits/frame: {:8.0f}  '
+              'frame time: mean {:.3f} ms  p90 {:.3f} ms'.format(
+                  name, size, phantom, 1000*times.mean(), 1000*np.percentile(times, 90)))
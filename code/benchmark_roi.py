@@ -0,0 +1,73 @@
+#Region of interest benchmark.
+#Replays a recorded run through perception and decision with the full camera frame, with the
+#default region of interest (the sky rows cropped off) and optionally with a sub-sampled region,
+#and compares the pixel work, the perception time, the resulting map and the decisions (mode,
+#throttle, brake and steering of every frame) against the full frame run.
+#
+#usage (from the code directory): python benchmark_roi.py <recording> [--limit N] [--step 2]
+import argparse
+import time
+
+import numpy as np
+
+from calibration import CameraCalibration, RegionOfInterest
+from decision import decision_step
+from perception import perception_step
+from polar_histogram import PolarHistogram
+from replay import load_frames
+from rover_state import RoverState
+from supporting_functions import update_rover
+from workspace import FrameWorkspace
+
+#a rover whose perception works on the given region of interest; everything built from the
+#calibration's window tables is rebuilt with it
+def rover_with_roi(roi):
+    Rover = RoverState()
+    Rover.calibration = CameraCalibration(roi=roi)
+    Rover.workspace = FrameWorkspace(Rover.calibration.roi_shape, Rover.calibration)
+    Rover.polar = PolarHistogram(Rover.workspace.window_angles)
+    return Rover
+
+#replay the frames, returning the rover, the perception_step times and the decisions taken
+def run(frames, roi):
+    Rover = rover_with_roi(roi)
+    times = []
+    decisions = []
+    for data, received in frames:
+        Rover = update_rover(Rover, data, received)
+        if not np.isfinite(Rover.vel):
+            continue
+        start = time.perf_counter()
+        Rover = perception_step(Rover)
+        times.append(time.perf_counter() - start)
+        Rover = decision_step(Rover)
+        if Rover.send_pickup and not Rover.picking_up:
+            Rover.send_pickup = False
+        decisions.append((Rover.mode, Rover.throttle, Rover.brake, Rover.steer))
+    return Rover, times, decisions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Region of interest benchmark')
+    parser.add_argument('recording', help='.rrec recording, a folder holding run.rrec, or a training mode folder')
+    parser.add_argument('--limit', type=int, default=None, help='Only replay the first N frames')
+    parser.add_argument('--step', type=int, default=None, help='Also run a region sub-sampled by this step')
+    args = parser.parse_args()
+
+    frames = list(load_frames(args.recording))[:args.limit]
+    regions = [('full frame', RegionOfInterest(top=0)), ('sky cropped', RegionOfInterest())]
+    if args.step is not None:
+        regions.append(('cropped, step {}'.format(args.step), RegionOfInterest(step=args.step)))
+
+    baseline = None
+    print('{:18s} {:>9s} {:>16s} {:>12s} {:>14s}'.format('region', 'pixels', 'perception (ms)', 'same map', 'same decisions'))
+    for name, roi in regions:
+        Rover, times, decisions = run(frames, roi)
+        worldmap = Rover.occupancy.render()
+        if baseline is None:
+            baseline = (worldmap, decisions)
+        roi_h, roi_w = Rover.calibration.roi_shape
+        same_map = np.array_equal(worldmap, baseline[0])
+        same_decisions = sum(a == b for a, b in zip(decisions, baseline[1]))
+        print('{:18s} {:9d} {:16.3f} {:>12s} {:>8d}/{:<5d}'.format(
+            name, roi_h * roi_w, 1000 * np.mean(times), 'yes' if same_map else 'NO',
+            same_decisions, len(decisions)))
@@ -0,0 +1,147 @@
+#Parallel offline map builder.
+#Rebuilds the world map of a recorded run (see recorder.py) on a process pool. The recording is
+#split into contiguous shards of records; each worker builds the hit counts and rock layer of its
+#shards with the batched perception (batch_perception.py) and writes them into its own slot of a
+#shared memory block, so no large arrays are pickled between processes. The partial grids merge by
+#summation: the counts add up (saturating like OccupancyGrid) and the rock layers are or-ed. Each
+#cell's state then comes from the final obstacle vs navigable comparison, as in perception_step.
+#
+#Cells whose final counts are tied are left unknown. The live map instead keeps whatever an earlier
+#frame decided for them, which depends on the frame order and is not mergeable, so the builder
+#reports how many cells are tied.
+#
+#usage (from the code directory):
+#  python build_map.py <recording> [--workers N] [--output worldmap.png] [--json stats.json]
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from batch_perception import decode_records, perceive_frames
+from calibration import CameraCalibration
+from map_statistics import MapStatistics
+from mapping import OccupancyGrid, MAX_HITS, OBSTACLE_CELL, NAVIGABLE_CELL
+from recorder import index_recording, read_records
+from rover_state import ground_truth_3d
+from supporting_functions import convert_to_float, overlay_worldmap
+
+#the channels of a partial grid slot: obstacle hits, navigable hits and the rock flag
+PARTIAL_CHANNELS = 3
+
+#the camera calibration of a worker process, computed on its first shard
+_calibration = None
+
+#Worker: build the partial grid of one shard of records into its shared memory slot.
+#Returns the number of frames perceived
+def build_shard(task):
+    global _calibration
+    path, offsets, shm_name, slot, n_slots, world_size, batch_size = task
+    if _calibration is None:
+        _calibration = CameraCalibration()
+    grid = OccupancyGrid(world_size)
+    n_frames = 0
+    #decode batch_size records at a time to bound the memory used
+    for start in range(0, len(offsets), batch_size):
+        images, poses = decode_records(read_records(path, offsets[start:start+batch_size]))
+        if len(images):
+            perceive_frames(images, poses, grid, _calibration, batch_size=batch_size)
+            n_frames += len(images)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        partials = np.ndarray((n_slots, world_size * world_size, PARTIAL_CHANNELS), dtype=np.uint16, buffer=shm.buf)
+        partials[slot, :, :2] = grid.counts
+        partials[slot, :, 2] = grid.rock_map().ravel()
+        del partials
+    finally:
+        shm.close()
+    return n_frames
+
+#merge the partial grids of all the shards into one OccupancyGrid
+def merge_partials(partials, world_size):
+    grid = OccupancyGrid(world_size)
+    counts = partials[:, :, :2].sum(axis=0, dtype=np.uint64)
+    grid.counts[:] = np.minimum(counts, MAX_HITS)
+    grid.state[grid.counts[:, 0] > grid.counts[:, 1]] = OBSTACLE_CELL
+    grid.state[grid.counts[:, 1] > grid.counts[:, 0]] = NAVIGABLE_CELL
+    grid.set_rocks(np.flatnonzero(partials[:, :, 2].any(axis=0)))
+    return grid
+
+#Build the map of a recording with `workers` processes. Returns the merged OccupancyGrid and the
+#number of frames perceived
+def build_map(path, workers, world_size=200, batch_size=64, shards_per_worker=4):
+    offsets = index_recording(path)
+    n_slots = max(1, min(len(offsets), workers * shards_per_worker))
+    shards = np.array_split(np.array(offsets, dtype=np.int64), n_slots)
+
+    shm = shared_memory.SharedMemory(create=True, size=n_slots * world_size * world_size * PARTIAL_CHANNELS * 2)
+    try:
+        partials = np.ndarray((n_slots, world_size * world_size, PARTIAL_CHANNELS), dtype=np.uint16, buffer=shm.buf)
+        partials[:] = 0
+        tasks = [(path, shard.tolist(), shm.name, slot, n_slots, world_size, batch_size)
+                 for slot, shard in enumerate(shards)]
+        if workers > 1:
+            with multiprocessing.Pool(workers) as pool:
+                n_frames = sum(pool.map(build_shard, tasks, chunksize=1))
+        else:
+            n_frames = sum(map(build_shard, tasks))
+        grid = merge_partials(partials, world_size)
+        del partials
+    finally:
+        shm.close()
+        shm.unlink()
+    return grid, n_frames
+
+#the known sample positions, from the first record of a recording
+def recorded_samples(path):
+    offsets = index_recording(path)
+    if not offsets:
+        return np.int_([]), np.int_([])
+    telemetry, _ = next(read_records(path, offsets[:1]))
+    return tuple(np.int_([convert_to_float(pos.strip()) for pos in telemetry[key].split(';') if pos.strip()])
+                 for key in ('samples_x', 'samples_y'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the world map of a recorded run in parallel')
+    parser.add_argument('recording', help='.rrec recording, or a folder holding run.rrec')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--batch-size', type=int, default=64, help='Frames per vectorized pass')
+    parser.add_argument('--output', default=None, help='Write the world map overlay image (PNG) here')
+    parser.add_argument('--json', default=None, help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    path = args.recording
+    if os.path.isdir(path):
+        path = os.path.join(path, 'run.rrec')
+
+    start = time.perf_counter()
+    grid, n_frames = build_map(path, args.workers, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+
+    #the create_output_images statistics of the merged map
+    stats = MapStatistics(ground_truth_3d, grid.world_size)
+    samples_pos = recorded_samples(path)
+    stats.set_samples(samples_pos)
+    stats.update(grid, np.arange(grid.world_size * grid.world_size))
+    tied = int(np.count_nonzero((grid.counts[:, 0] == grid.counts[:, 1]) & (grid.counts[:, 0] > 0)))
+
+    results = {'frames': n_frames, 'workers': args.workers, 'seconds': elapsed,
+               'fps': n_frames / elapsed if elapsed > 0 else 0,
+               'perc_mapped': stats.perc_mapped(), 'fidelity': stats.fidelity(),
+               'samples_located': len(stats.located()), 'tied_cells': tied}
+    print('{} frames on {} workers in {:.2f} s: {:.1f} frames/sec'.format(
+        n_frames, args.workers, elapsed, results['fps']))
+    print('mapped {}%, fidelity {}%, samples located {}, tied cells {}'.format(
+        results['perc_mapped'], results['fidelity'], results['samples_located'], tied))
+
+    if args.output is not None:
+        map_add, _ = overlay_worldmap(grid, stats, samples_pos)
+        cv2.imwrite(args.output, cv2.cvtColor(np.flipud(map_add), cv2.COLOR_RGB2BGR))
+    if args.json is not None:
+        with open(args.json, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
@@ -0,0 +1,109 @@
+import numpy as np
+import cv2
+
+#perspective transform grid corner source, measured from calibration_images/grid.jpg
+SOURCE = np.float32([[6.7,145.5],
+                     [306.1, 142.7],
+                     [ 197.7, 96.8],
+                     [118.2, 96.7]])
+
+DST_SIZE = 10 #perspective transform scale
+BOTTOM_OFFSET = 6 #perspective transform offset
+
+#perspecive transform grid corner destination
+#maps the rover perspective to the bottom middle of the top down view
+def destination_points(img_w, img_h, dst_size=DST_SIZE, bottom_offset=BOTTOM_OFFSET):
+    return np.float32([[img_w/2 - dst_size/2, img_h - bottom_offset],
+                  [img_w/2 + dst_size/2, img_h - bottom_offset],
+                  [img_w/2 + dst_size/2, img_h - dst_size - bottom_offset],
+                  [img_w/2 - dst_size/2, img_h - dst_size - bottom_offset],
+                  ])
+
+#The part of the camera image perception works on: rows top to bottom and columns left to right,
+#optionally sub-sampled by taking every step-th row and column. The rows above the horizon never
+#show navigable terrain or rocks, so by default the top 60 rows (the sky) are left out. Perception
+#paths get a view of the region instead of a copy of the frame with the sky zeroed out.
+class RegionOfInterest():
+    def __init__(self, top=60, bottom=None, left=0, right=None, step=1):
+        self.top = top
+        self.bottom = bottom
+        self.left = left
+        self.right = right
+        self.step = step
+
+    #the region of a camera image, as a view (no copy)
+    def view(self, img):
+        return img[self.top:self.bottom:self.step, self.left:self.right:self.step]
+
+    #the (height, width) of the region of an image of the given shape
+    def shape(self, img_shape):
+        img_h, img_w = img_shape[:2]
+        return (len(range(*slice(self.top, self.bottom, self.step).indices(img_h))),
+                len(range(*slice(self.left, self.right, self.step).indices(img_w))))
+
+    #the 3x3 homogeneous transform from region (x, y) coordinates to camera image coordinates
+    def view_to_camera(self):
+        return np.float64([[self.step, 0, self.left],
+                           [0, self.step, self.top],
+                           [0, 0, 1]])
+
+    #the number of rows of the region that are among the top `pixels_to_cut` camera rows
+    def rows_to_cut(self, pixels_to_cut):
+        return max(0, -(-(pixels_to_cut - self.top) // self.step))
+
+#The camera calibration never changes, so everything the perception step needs to know about
+#the camera geometry is computed once here. For every top down pixel that the camera can see we
+#store the camera pixel it is sampled from (exactly what cv2.warpPerspective does with nearest
+#neighbour interpolation), its rover centric coordinates, distance and angle, and whether it lies
+#within the range/angle window that the perception paths trust. Perception then becomes a gather
+#into these tables with no warp, arctan2 or sqrt per frame. The camera pixels are indexed within
+#the region of interest (see RegionOfInterest), so the tables gather from a label image of the
+#region only; top down pixels sampled from outside of the region are left out.
+class CameraCalibration():
+    def __init__(self, img_shape=(160, 320), source=SOURCE, max_distance=80, max_angle=30, roi=None):
+        img_h, img_w = img_shape[:2]
+        self.img_shape = (img_h, img_w)
+        self.roi = roi or RegionOfInterest()
+        self.roi_shape = self.roi.shape(self.img_shape)
+        self.source = source
+        self.destination = destination_points(img_w, img_h)
+        self.M = cv2.getPerspectiveTransform(self.source, self.destination)
+
+        #sample the camera image for every top down pixel through the inverse transform, rounding
+        #to the nearest camera pixel like cv2.warpPerspective(..., flags=cv2.INTER_NEAREST)
+        ypos, xpos = np.mgrid[0:img_h, 0:img_w]
+        top_down = np.dstack((xpos, ypos)).reshape(-1, 1, 2).astype(np.float64)
+        camera = cv2.perspectiveTransform(top_down, np.linalg.inv(self.M)).reshape(-1, 2)
+        cam_x = np.rint(camera[:, 0])
+        cam_y = np.rint(camera[:, 1])
+        #the nearest pixel of the (sub-sampled) region of interest
+        roi_h, roi_w = self.roi_shape
+        roi_x = np.rint((cam_x - self.roi.left) / self.roi.step)
+        roi_y = np.rint((cam_y - self.roi.top) / self.roi.step)
+        in_view = (roi_x >= 0) & (roi_x < roi_w) & (roi_y >= 0) & (roi_y < roi_h)
+        in_view &= (cam_x >= 0) & (cam_x < img_w) & (cam_y >= 0) & (cam_y < img_h)
+
+        #flat index of the region of interest pixel each visible top down pixel is sampled from
+        #(kept in row-major top down order, the same order rover_coords returns pixels in)
+        self.src_index = (roi_y[in_view] * roi_w + roi_x[in_view]).astype(np.intp)
+        #and the flat index of that pixel in the full camera image
+        self.camera_index = ((self.roi.top + roi_y[in_view] * self.roi.step) * img_w +
+                             self.roi.left + roi_x[in_view] * self.roi.step).astype(np.intp)
+
+        #rover centric coordinates, distances and angles of the visible top down pixels
+        self.xpix = -(ypos.ravel()[in_view] - img_h).astype(np.float64)
+        self.ypix = -(xpos.ravel()[in_view] - img_w/2).astype(np.float64)
+        #the same coordinates as interleaved float32 (x, y) pairs, ready for world_transform
+        self.rover_xy = np.stack((self.xpix, self.ypix), axis=1).astype(np.float32)
+        self.dist = np.sqrt(self.xpix**2 + self.ypix**2)
+        self.angles = np.arctan2(self.ypix, self.xpix)
+
+        #range/angle windows. The navigable and obstacle paths drop anything at or beyond
+        #max_distance and anything outside of max_angle; the rock path keeps both boundaries
+        angle_sqr = (self.angles*180/np.pi)**2
+        self.terrain_window = (self.dist < max_distance) & (angle_sqr <= max_angle**2)
+        self.rock_window = (self.dist <= max_distance) & (angle_sqr < max_angle**2)
+
+    #gather the per pixel flags of a region of interest label image into top down order
+    def gather(self, labels):
+        return labels.ravel()[self.src_index]
@@ -0,0 +1,156 @@
+#Equivalence checks for the world map.
+#The world map moved from float64 RGB/count images updated with np.add.at to the incremental
+#OccupancyGrid, then to the sparse TiledOccupancyGrid, and the map statistics and output images
+#moved to incremental updates on top of them. This script checks that each of them still gives
+#the same results as the representation it replaced:
+#  - OccupancyGrid.update against np.add.at count images, over random frames of hits
+#  - TiledOccupancyGrid against the dense OccupancyGrid (update results, cell states and renders)
+#  - MapStatistics against a full rescan of the rendered world map
+#  - the output images of a recorded run replayed with the tiled and with the dense grid
+#Exits non-zero if any check fails.
+#
+#usage (from the code directory): python check_map_equivalence.py [recording] [--frames N] [--seed S]
+import argparse
+import sys
+
+import numpy as np
+
+from decision import decision_step
+from map_statistics import MapStatistics
+from mapping import OccupancyGrid, TiledOccupancyGrid
+from perception import perception_step
+from replay import load_frames
+from rover_state import RoverState, ground_truth_3d
+from supporting_functions import update_rover, create_output_images
+
+#a random frame of (x world, y world) hits: obstacles, navigable terrain and rocks, clustered
+#around a random rover position as perception would give them
+def random_frame(random, world_size):
+    x0, y0 = random.randint(0, world_size, 2)
+    def hits(count, spread):
+        x = np.clip(x0 + random.randint(-spread, spread + 1, count), 0, world_size - 1)
+        y = np.clip(y0 + random.randint(-spread, spread + 1, count), 0, world_size - 1)
+        return x, y
+    return hits(random.randint(0, 400), 12), hits(random.randint(0, 800), 12), hits(random.randint(0, 3), 8)
+
+#The world map as it used to be kept: obstacle and navigable hit counts accumulated with
+#np.add.at, a cell's state taken from whichever count is larger and rocks flagged for good
+class ReferenceMap():
+    def __init__(self, world_size):
+        self.counts = np.zeros((world_size, world_size, 2))
+        self.state = np.zeros((world_size, world_size), dtype=np.uint8)
+        self.rocks = np.zeros((world_size, world_size), dtype=bool)
+
+    def update(self, obstacles, navigable, rocks):
+        np.add.at(self.counts[:, :, 0], (obstacles[1], obstacles[0]), 1)
+        np.add.at(self.counts[:, :, 1], (navigable[1], navigable[0]), 1)
+        touched = np.zeros(self.rocks.shape, dtype=bool)
+        touched[obstacles[1], obstacles[0]] = True
+        touched[navigable[1], navigable[0]] = True
+        touched &= ~self.rocks
+        self.state[touched & (self.counts[:, :, 0] > self.counts[:, :, 1])] = 1
+        self.state[touched & (self.counts[:, :, 1] > self.counts[:, :, 0])] = 2
+        self.rocks[rocks[1], rocks[0]] = True
+
+#percentage mapped, fidelity and located samples worked out from scratch over a rendered world map
+def rescanned_statistics(worldmap, samples_pos, radius=3):
+    gt_h, gt_w = ground_truth_3d.shape[:2]
+    navigable = worldmap[:gt_h, :gt_w, 2] > 0
+    on_ground_truth = ground_truth_3d[:, :, 1] > 0
+    good = np.count_nonzero(navigable & on_ground_truth)
+    perc_mapped = round(100*good/np.count_nonzero(on_ground_truth), 1)
+    fidelity = round(100*good/np.count_nonzero(navigable), 1) if navigable.any() else 0
+    rock_y, rock_x = (worldmap[:, :, 1] > 0).nonzero()
+    located = [idx for idx in range(len(samples_pos[0]))
+               if (np.sqrt((rock_x - samples_pos[0][idx])**2 + (rock_y - samples_pos[1][idx])**2) < radius).any()]
+    return perc_mapped, fidelity, located
+
+#OccupancyGrid.update against the np.add.at reference, frame by frame
+def check_dense_grid(random, frames, world_size=200):
+    grid = OccupancyGrid(world_size)
+    reference = ReferenceMap(world_size)
+    for _ in range(frames):
+        frame = random_frame(random, world_size)
+        grid.update(*frame)
+        reference.update(*frame)
+        counts = grid.counts.reshape(world_size, world_size, 2)
+        if not (np.array_equal(counts, reference.counts)
+                and np.array_equal(grid.state.reshape(world_size, world_size), reference.state)
+                and np.array_equal(grid.rock_map(), reference.rocks)):
+            return False
+    return True
+
+#TiledOccupancyGrid against the dense OccupancyGrid, on a world size that is not a multiple of
+#the tile size, rendering a different extent every few frames
+def check_tiled_grid(random, frames, world_size=200, tile_size=32):
+    dense = OccupancyGrid(world_size)
+    tiled = TiledOccupancyGrid(world_size, tile_size)
+    all_cells = np.arange(world_size * world_size)
+    extents = [None, (world_size, world_size), (160, 190), (1, 1), (50, world_size), (world_size + 40, 80)]
+    for idx in range(frames):
+        frame = random_frame(random, world_size)
+        dense_touched = dense.update(*frame)
+        tiled_touched = tiled.update(*frame)
+        if not np.array_equal(np.sort(tiled_touched), dense_touched):
+            return False
+        extent = extents[idx % len(extents)]
+        if not (np.array_equal(tiled.cell_states(all_cells), dense.cell_states(all_cells))
+                and np.array_equal(tiled.render(extent), dense.render(extent))):
+            return False
+    return True
+
+#MapStatistics kept up to date incrementally against a full rescan after every frame
+def check_statistics(random, frames, world_size=200):
+    grid = TiledOccupancyGrid(world_size)
+    stats = MapStatistics(ground_truth_3d, world_size)
+    samples_pos = (random.randint(0, 200, 6), random.randint(0, 200, 6))
+    stats.set_samples(samples_pos)
+    for _ in range(frames):
+        stats.update(grid, grid.update(*random_frame(random, world_size)))
+        perc_mapped, fidelity, located = rescanned_statistics(grid.render(), samples_pos)
+        if (stats.perc_mapped(), stats.fidelity(), list(stats.located())) != (perc_mapped, fidelity, located):
+            return False
+    return True
+
+#the output images of a recorded run, replayed with the tiled and with the dense grid
+def check_output_images(recording, frames):
+    dense_rover = RoverState()
+    dense_rover.occupancy = OccupancyGrid(dense_rover.world_size)
+    rovers = [RoverState(), dense_rover]
+    for data, received in list(load_frames(recording))[:frames]:
+        images = []
+        for Rover in rovers:
+            Rover = update_rover(Rover, data, received)
+            if not np.isfinite(Rover.vel):
+                continue
+            Rover = perception_step(Rover)
+            Rover = decision_step(Rover)
+            if Rover.send_pickup and not Rover.picking_up:
+                Rover.send_pickup = False
+            images.append(create_output_images(Rover))
+        if images and images[0] != images[1]:
+            return False
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='World map equivalence checks')
+    parser.add_argument('recording', nargs='?', default=None,
+                        help='.rrec recording, a folder holding run.rrec, or a training mode folder '
+                             'to compare the output images of (skipped if not given)')
+    parser.add_argument('--frames', type=int, default=300, help='Frames per check')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the random frames')
+    args = parser.parse_args()
+
+    random = np.random.RandomState(args.seed)
+    checks = [('OccupancyGrid vs np.add.at', lambda: check_dense_grid(random, args.frames)),
+              ('tiled vs dense grid', lambda: check_tiled_grid(random, args.frames)),
+              ('incremental vs rescanned statistics', lambda: check_statistics(random, args.frames))]
+    if args.recording is not None:
+        checks.append(('tiled vs dense output images', lambda: check_output_images(args.recording, args.frames)))
+
+    failed = 0
+    for name, check in checks:
+        same = check()
+        failed += not same
+        print('{:38s} {}'.format(name, 'identical' if same else 'DIFFERENT'))
+    sys.exit(1 if failed else 0)
@@ -3,13 +3,13 @@ import numpy as np
 # This is where you can build a decision tree for determining throttle, brake and steer 
 # commands based on the output of the perception_step() function
 
-#if the rovers naviagable path values are greater than the threshold for a clear path,
-#we can assume there is a clear path ahead. #NOTE: this is not always true, such as in
+#if the rover sees more navigable terrain pixels (inside the range/angle window) than the
+#threshold for a clear path, we can assume there is a clear path ahead. #NOTE: this is not always true, such as in
 #the case that there is a small rock in the Rover's path; need to implement a seperate
 #function that detects if the rover is stuck in one place for too long to take care of
 #these issues
 def clear_path(Rover):
-    if Rover.nav_dists.mean() > Rover.clear_path:
+    if Rover.polar.nav_total > Rover.clear_path_pixels:
         return True
     else:
         return False
@@ -23,8 +23,11 @@ def go_forward(Rover):
     else: # Else coast
         Rover.throttle = 0
 
-    #steer in the direction of the greatest average navigable path
-    Rover.steer = np.clip(np.mean(Rover.nav_angles * 180/np.pi)*Rover.aggresive_steering_amplitude, -15, 15)
+    #steer in the direction of the greatest average navigable path (straight if none is in view)
+    if Rover.polar.nav_total > 0:
+        Rover.steer = np.clip(Rover.polar.nav_mean_angle * 180/np.pi*Rover.aggresive_steering_amplitude, -15, 15)
+    else:
+        Rover.steer = 0
     
     if not Rover.wall_on_left:
         #if the wall is not seen on the left of the rover, aggressively steer in it's direction
@@ -53,9 +56,17 @@ def stuck(Rover):
             Rover.mode = "Stuck"
             stop(Rover)
 
+#the rocks in view that have not been collected yet, largest first
+def uncollected_rocks(Rover):
+    return [rock for rock in Rover.rocks if rock.entry is None or not rock.entry.collected]
+
+#switch to ROCK mode when the largest rock in view that has not been collected yet is big enough
+#to be worth driving to, and remember its registry entry as the target
 def found_rock(Rover):
-    if len(Rover.rock_angles) > Rover.rock_thresh:
+    rocks = uncollected_rocks(Rover)
+    if rocks and rocks[0].pixels > Rover.rock_thresh:
         Rover.mode = "ROCK"
+        Rover.target_rock = rocks[0].entry
         Rover.rock_mode_stage = 0
         Rover.pos_when_finding_rock = Rover.pos
         Rover.yaw_when_finding_rock = Rover.yaw
@@ -74,7 +85,7 @@ def stop(Rover):
 def decision_step(Rover):
 
     #if our data is good
-    if Rover.nav_angles is not None:
+    if Rover.polar.valid:
         
         if Rover.mode == "Find Wall":
             #at the start we need to find a wall to follow in the first place
@@ -168,8 +179,10 @@ def decision_step(Rover):
                     #stop the rover
                     Rover.brake = 0
                     Rover.throttle = 0.1
-                    if len(Rover.rock_angles) >0:
-                        Rover.steer = np.clip(np.mean(Rover.rock_angles * 180/np.pi), -15, 15)
+                    #steer towards the target rock, or the largest uncollected rock if it is out of view
+                    rocks = [rock for rock in Rover.rocks if rock.entry is Rover.target_rock] or uncollected_rocks(Rover)
+                    if rocks:
+                        Rover.steer = np.clip(rocks[0].angle * 180/np.pi, -15, 15)
                     else:
                         Rover.steer = 0
                 else:
@@ -178,6 +191,9 @@ def decision_step(Rover):
                     else:
                         Rover.brake = 0
                         Rover.send_pickup = True
+                        #never approach this rock again
+                        if Rover.target_rock is not None:
+                            Rover.rock_registry.mark_collected(Rover.target_rock)
                         Rover.rover_stuck_yaw = Rover.yaw
                         Rover.mode = "Stuck"
             else:
@@ -2,7 +2,6 @@
 import argparse
 import shutil
 import base64
-from datetime import datetime
 import os
 import cv2
 import numpy as np
@@ -10,104 +9,27 @@ import socketio
 import eventlet
 import eventlet.wsgi
 from PIL import Image
-from flask import Flask
+from flask import Flask, jsonify
 from io import BytesIO, StringIO
 import json
 import pickle
-import matplotlib.image as mpimg
 import time
 
 # Import functions for perception and decision making
 from perception import perception_step
 from decision import decision_step
+from rover_state import RoverState
 from supporting_functions import update_rover, create_output_images
+from rover_log import log, configure_logging, LEVELS
+from pipeline import PerceptionPipeline
+from recorder import FrameRecorder
+from probes import probe, enable_probes, metrics
 # Initialize socketio server and Flask application 
 # (learn more at: https://python-socketio.readthedocs.io/en/latest/)
 sio = socketio.Server()
 app = Flask(__name__)
 
-# Read in ground truth map and create 3-channel green version for overplotting
-# NOTE: images are read in by default with the origin (0, 0) in the upper left
-# and y-axis increasing downward.
-ground_truth = mpimg.imread('../calibration_images/map_bw.png')
-# This next line creates arrays of zeros in the red and blue channels
-# and puts the map into the green channel.  This is why the underlying 
-# map output looks green in the display image
-ground_truth_3d = np.dstack((ground_truth*0, ground_truth*255, ground_truth*0)).astype(np.float)
-
-# Define RoverState() class to retain rover state parameters
-class RoverState():
-    def __init__(self):
-        self.start_time = None # To record the start time of navigation
-        self.total_time = None # To record total duration of naviagation
-        self.img = None # Current camera image
-        self.pos = None # Current position (x, y)
-        self.yaw = None # Current yaw angle
-        self.pitch = None # Current pitch angle
-        self.roll = None # Current roll angle
-        self.vel = None # Current velocity
-        self.steer = 0 # Current steering angle
-        self.throttle = 0 # Current throttle value
-        self.brake = 0 # Current brake value
-        self.nav_angles = None # Angles of navigable terrain pixels
-        self.nav_dists = None # Distances of navigable terrain pixels
-        self.ground_truth = ground_truth_3d # Ground truth worldmap
-        self.mode = 'Find Wall' # Current rover mode
-        self.throttle_set = .5 # Throttle setting when accelerating
-        self.brake_set = 5 # Brake setting when braking
-        self.max_vel = 1.5 # Maximum velocity (meters/second)
-        # Image output from perception step
-        # Update this image to display your intermediate analysis steps
-        # on screen in autonomous mode
-        self.vision_image = np.zeros((160, 320, 3), dtype=np.float) 
-        # Worldmap
-        # Update this image with the positions of navigable terrain
-        # obstacles and rock samples
-        self.worldmap = np.zeros((200, 200, 3), dtype=np.float)
-        self.map_count = np.zeros_like(self.worldmap) #determines if obstacle or navigable
-        self.samples_pos = None # To store the actual sample positions
-        self.samples_to_find = 0 # To store the initial count of samples
-        self.samples_located = 0 # To store number of samples located on map
-        self.samples_collected = 0 # To count the number of samples collected
-        self.near_sample = 0 # Will be set to telemetry value data["near_sample"]
-        self.picking_up = 0 # Will be set to telemetry value data["picking_up"]
-        self.send_pickup = False # Set to True to trigger rock pickup
-        self.wall_on_left = None # Boolean if wall on left of rover
-        self.wall_on_left_threshold_pix = 600 #the threshold for determining if there is a wall on the
-            #left of the rover
-        self.wall_left_amount = None #for outputting/debugging
-        self.time_without_seeing_wall = 0 #record how long we havent seen a wall on the left
-        self.time_lost_wall_threshold =5 #if we havent seen a wall for this long, we lost the wall
-        self.time_last = 0.0 #the last time recorded
-        self.time_mean_distance_less_than_thresh = 0 #record how long an obstacle is in our path
-        self.max_time_mean_distance_less_than_thresh = 1.5  #if obstacle in path for this long, not clear path.
-        self.aggresive_steering_amplitude = 3.5 #How aggresive the rover is when steering towards an optimal path
-        self.clear_path = 6 #The threshold for determining if there is a clear path for the rover
-
-        self.rover_stuck_check_interval = 10 #check if the rover is stuck this often (seconds)
-        self.rover_stuck_check_time_last_checked = 0
-        self.rover_stuck_check_distance_threshold = 0.5
-        #store these positions to compare with at each stuck-check interval
-        self.rover_stuck_check_last_x = 0 
-        self.rover_stuck_check_last_y = 0
-        self.rover_stuck_yaw = None
-
-        #rock mode
-        self.pos_when_finding_rock = None
-        self.yaw_when_finding_rock = None
-        self.rock_angles = None
-        self.rock_distances = None
-        self.rock_thresh = 10
-        self.time_rock_max = 20
-        self.time_rock = 0
-
-        
-     
-        
-        
-
-        
-        
+
 # Initialize our rover 
 Rover = RoverState()
 
@@ -118,6 +40,11 @@ frame_counter = 0
 second_counter = time.time()
 fps = None
 
+# Perception worker, only used in pipelined mode (--pipelined)
+pipeline = None
+# Background run recorder, only used when an image folder is given
+recorder = None
+
 
 # Define telemetry function for what to do with incoming data
 @sio.on('telemetry')
@@ -130,21 +57,43 @@ def telemetry(sid, data):
         fps = frame_counter
         frame_counter = 0
         second_counter = time.time()
-    print("Current FPS: {}".format(fps))
+    log.info("Current FPS: %s", fps)
+
+    # If you want to record the run from autonomous driving specify a path
+    # Example: $ python drive_rover.py image_folder_path
+    # The frames are recorded in the background, in a single file in that folder
+    if data and recorder is not None:
+        recorder.record(data)
+
+    if data and pipeline is not None:
+        # Hand the frame to the perception worker and answer right away
+        # with the freshest control command it has produced
+        pipeline.submit(data)
+        reply = pipeline.reply()
+        if reply is None:
+            send_control((0, 0, 0), '', '')
+        elif reply[0] == 'pickup':
+            send_pickup()
+        else:
+            commands, out_image_string1, out_image_string2 = reply[1]
+            send_control(commands, out_image_string1, out_image_string2)
 
-    if data:
+    elif data:
         global Rover
         # Initialize / update Rover with current telemetry
-        Rover, image = update_rover(Rover, data)
+        Rover = update_rover(Rover, data)
 
         if np.isfinite(Rover.vel):
 
             # Execute the perception and decision steps to update the Rover's state
-            Rover = perception_step(Rover)
-            Rover = decision_step(Rover)
+            with probe('perception'):
+                Rover = perception_step(Rover)
+            with probe('decision'):
+                Rover = decision_step(Rover)
 
             # Create output images to send to server
-            out_image_string1, out_image_string2 = create_output_images(Rover)
+            with probe('output'):
+                out_image_string1, out_image_string2 = create_output_images(Rover)
 
             # The action step!  Send commands to the rover!
  
@@ -168,20 +117,25 @@ def telemetry(sid, data):
             # Send zeros for throttle, brake and steer and empty images
             send_control((0, 0, 0), '', '')
 
-        # If you want to save camera images from autonomous driving specify a path
-        # Example: $ python drive_rover.py image_folder_path
-        # Conditional to save image frame if folder was specified
-        if args.image_folder != '':
-            timestamp = datetime.utcnow().strftime('%Y_%m_%d_%H_%M_%S_%f')[:-3]
-            image_filename = os.path.join(args.image_folder, timestamp)
-            image.save('{}.jpg'.format(image_filename))
-
     else:
         sio.emit('manual', data={}, skip_sid=True)
 
+# Serve the rolling per-stage timings of the frame loop (see probes.py),
+# e.g. $ curl http://localhost:4567/metrics
+@app.route('/metrics')
+def stage_metrics():
+    results = metrics()
+    results['fps'] = fps
+    if pipeline is not None:
+        results['frames_dropped'] = pipeline.frames.dropped
+        results['outputs_skipped'] = pipeline.outputs.dropped
+    if recorder is not None:
+        results['frames_recorded'] = recorder.frames_written
+    return jsonify(results)
+
 @sio.on('connect')
 def connect(sid, environ):
-    print("connect ", sid)
+    log.info("connect %s", sid)
     send_control((0, 0, 0), '', '')
     sample_data = {}
     sio.emit(
@@ -199,19 +153,21 @@ def send_control(commands, image_string1, image_string2):
         'inset_image2': image_string2,
         }
     # Send commands via socketIO server
-    sio.emit(
-        "data",
-        data,
-        skip_sid=True)
+    with probe('emit'):
+        sio.emit(
+            "data",
+            data,
+            skip_sid=True)
     eventlet.sleep(0)
 # Define a function to send the "pickup" command 
 def send_pickup():
-    print("Picking up")
+    log.info("Picking up")
     pickup = {}
-    sio.emit(
-        "pickup",
-        pickup,
-        skip_sid=True)
+    with probe('emit'):
+        sio.emit(
+            "pickup",
+            pickup,
+            skip_sid=True)
     eventlet.sleep(0)
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Remote Driving')
@@ -220,9 +176,43 @@ if __name__ == '__main__':
         type=str,
         nargs='?',
         default='',
-        help='Path to image folder. This is where the images from the run will be saved.'
+        help='Path to image folder. This is where the run will be recorded (camera images and '
+             'telemetry, in a single run.rrec file).'
+    )
+    parser.add_argument(
+        '--log-level',
+        choices=list(LEVELS),
+        default=None,
+        help='Logging level, "silent" turns logging off (default: $ROVER_LOG_LEVEL or info).'
+    )
+    parser.add_argument(
+        '--log-sink',
+        default=None,
+        help='Where log records go: stderr, ring or file:<path> (default: $ROVER_LOG_SINK or stderr).'
+    )
+    parser.add_argument(
+        '--pipelined',
+        action='store_true',
+        help='Run perception, decision and output rendering on a worker thread and answer '
+             'each frame with the freshest control command.'
+    )
+    parser.add_argument(
+        '--probes',
+        action='store_true',
+        help='Time the frame loop stages and serve their latency histograms on /metrics '
+             '(also enabled by $ROVER_PROBES=1).'
+    )
+    parser.add_argument(
+        '--world-size',
+        type=int,
+        default=200,
+        help='Size of the (square) world map in cells (meters), at least the 200 of the ground truth map.'
     )
     args = parser.parse_args()
+    Rover = RoverState(world_size=args.world_size)
+    configure_logging(args.log_level, args.log_sink)
+    if args.probes:
+        enable_probes()
     
     #os.system('rm -rf IMG_stream/*')
     if args.image_folder != '':
@@ -233,11 +223,21 @@ if __name__ == '__main__':
             shutil.rmtree(args.image_folder)
             os.makedirs(args.image_folder)
         print("Recording this run ...")
+        recorder = FrameRecorder(os.path.join(args.image_folder, 'run.rrec'))
     else:
         print("NOT recording this run ...")
     
+    if args.pipelined:
+        pipeline = PerceptionPipeline(Rover)
+        pipeline.start()
+
     # wrap Flask application with socketio's middleware
     app = socketio.Middleware(sio, app)
 
     # deploy as an eventlet WSGI server
-    eventlet.wsgi.server(eventlet.listen(('', 4567)), app)
+    try:
+        eventlet.wsgi.server(eventlet.listen(('', 4567)), app)
+    finally:
+        # write out the frames still queued for recording
+        if recorder is not None:
+            recorder.close()
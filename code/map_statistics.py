@@ -0,0 +1,93 @@
+import numpy as np
+
+from mapping import NAVIGABLE_CELL, ROCK_CELL
+
+#Spatial index of the known sample positions, built once when the sample positions are first
+#received. Maps every world map cell within 3 meters of a sample to the samples it is close to,
+#so checking whether a rock detection is near a sample is a single dictionary lookup per rock cell.
+class SampleProximityIndex():
+    def __init__(self, samples_pos, world_size=200, radius=3):
+        self.n_samples = len(samples_pos[0])
+        self.near = {} #flat world map cell index -> indices of the samples within radius of it
+        offsets = np.arange(-radius, radius + 1)
+        dx, dy = np.meshgrid(offsets, offsets)
+        for idx in range(self.n_samples):
+            x = samples_pos[0][idx] + dx
+            y = samples_pos[1][idx] + dy
+            #If rocks were detected within 3 meters of known sample positions consider it a success
+            close = (np.sqrt(dx**2 + dy**2) < radius) & (x >= 0) & (x < world_size) & (y >= 0) & (y < world_size)
+            for cell in (y[close] * world_size + x[close]):
+                self.near.setdefault(int(cell), []).append(idx)
+
+    #the indices of the samples within radius of any of the given flat world map cells
+    def samples_near(self, cells):
+        found = set()
+        for cell in cells:
+            found.update(self.near.get(int(cell), ()))
+        return found
+
+#Keeps the map statistics shown by create_output_images (mapped %, fidelity and located samples)
+#up to date incrementally. The ground truth constants are computed once, and each frame only the
+#world map cells that changed are looked at, so the reporting cost does not grow with the map size.
+class MapStatistics():
+    def __init__(self, ground_truth, world_size=200):
+        self.world_size = world_size
+        self.gt_h, self.gt_w = ground_truth.shape[:2]
+        #ground truth navigable cells, and their total count
+        self.on_ground_truth = (ground_truth[:,:,1] > 0).ravel()
+        self.tot_map_pix = np.count_nonzero(self.on_ground_truth)
+        #the ground truth map at half intensity, the background of the output map image
+        self.background = (ground_truth * 0.5).astype(np.uint8)
+
+        #ground truth area cells currently navigable on the world map
+        self.navigable = np.zeros(self.on_ground_truth.size, dtype=bool)
+        self.tot_nav_pix = 0 #number of navigable cells
+        self.good_nav_pix = 0 #number of navigable cells that are also navigable in the ground truth
+        self.sample_index = None #SampleProximityIndex of the known sample positions
+        self.samples_located = None #one flag per known sample position, set once a rock is found near it
+
+    #build the sample proximity index once the sample positions are known
+    def set_samples(self, samples_pos):
+        self.sample_index = SampleProximityIndex(samples_pos, self.world_size)
+        self.samples_located = np.zeros(self.sample_index.n_samples, dtype=bool)
+
+    #Update the statistics with the world map cells that changed this frame, as returned by
+    #the occupancy grid update, and check new rock cells against the known sample positions
+    def update(self, grid, cells):
+        states = grid.cell_states(cells)
+
+        #rock cells located near a known sample
+        rocks = states == ROCK_CELL
+        if self.sample_index is not None and rocks.any():
+            self.samples_located[list(self.sample_index.samples_near(cells[rocks]))] = True
+
+        #only the cells inside the ground truth map are scored
+        x = cells % self.world_size
+        y = cells // self.world_size
+        inside = (x < self.gt_w) & (y < self.gt_h)
+        states, x, y = states[inside], x[inside], y[inside]
+
+        #add the cells that became navigable and remove the ones that stopped being navigable
+        gt_cells = y * self.gt_w + x
+        now_navigable = states == NAVIGABLE_CELL
+        changed = now_navigable != self.navigable[gt_cells]
+        delta = np.where(now_navigable[changed], 1, -1)
+        self.tot_nav_pix += int(delta.sum())
+        self.good_nav_pix += int(delta[self.on_ground_truth[gt_cells[changed]]].sum())
+        self.navigable[gt_cells[changed]] = now_navigable[changed]
+
+    #the indices of the known samples that have been located
+    def located(self):
+        if self.samples_located is None:
+            return np.zeros(0, dtype=np.intp)
+        return np.flatnonzero(self.samples_located)
+
+    #percentage of the ground truth map that has been successfully found
+    def perc_mapped(self):
+        return round(100*self.good_nav_pix/self.tot_map_pix, 1)
+
+    #number of good map pixel detections divided by total pixels found to be navigable terrain
+    def fidelity(self):
+        if self.tot_nav_pix > 0:
+            return round(100*self.good_nav_pix/self.tot_nav_pix, 1)
+        return 0
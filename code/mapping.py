@@ -0,0 +1,179 @@
+import numpy as np
+
+#cell states of an OccupancyGrid
+UNKNOWN = 0
+OBSTACLE_CELL = 1
+NAVIGABLE_CELL = 2
+ROCK_CELL = 3 #only reported by cell_states, rocks are kept in a separate layer
+
+#RGB colors of the rendered world map, indexed by cell state
+#obstacles are red (255,0,0), naviagable terrain is blue (0,0,255) and rocks are green (0,255,0)
+STATE_COLORS = np.uint8([[0, 0, 0], [255, 0, 0], [0, 0, 255]])
+ROCK_COLOR = np.uint8([0, 255, 0])
+
+#largest value an OccupancyGrid hit counter can hold
+MAX_HITS = np.iinfo(np.uint16).max
+
+#count the hits per world map cell of a set of world coordinates.
+#Returns the flat cell indices that were hit and how many times each one was hit,
+#so duplicate cells within a frame are all counted
+def cell_hits(x_world, y_world, world_size):
+    return np.unique(cells_of(x_world, y_world, world_size), return_counts=True)
+
+#flat cell indices of a set of world coordinates
+def cells_of(x_world, y_world, world_size):
+    return np.asarray(y_world, dtype=np.intp) * world_size + np.asarray(x_world, dtype=np.intp)
+
+#Compact world map of the rover's surroundings. Rather than float64 RGB/count images, each cell
+#holds two saturating uint16 hit counters (obstacle, navigable), a uint8 state and one bit of a
+#bit-packed rock layer; the RGB world map is only rendered on demand.
+class OccupancyGrid():
+    def __init__(self, world_size=200):
+        self.world_size = world_size
+        n_cells = world_size * world_size
+        self.counts = np.zeros((n_cells, 2), dtype=np.uint16) #obstacle (0) and navigable (1) hits
+        self.state = np.zeros(n_cells, dtype=np.uint8) #UNKNOWN, OBSTACLE_CELL or NAVIGABLE_CELL
+        self.rock_bits = np.zeros((n_cells + 7) // 8, dtype=np.uint8) #one bit per cell
+
+    #True for each flat cell index that has had a rock detected in it
+    def is_rock(self, cells):
+        return (self.rock_bits[cells >> 3] & (0x80 >> (cells & 7)).astype(np.uint8)) > 0
+
+    #flag the given flat cell indices as rocks
+    def set_rocks(self, cells):
+        np.bitwise_or.at(self.rock_bits, cells >> 3, (0x80 >> (cells & 7)).astype(np.uint8))
+
+    #add hits to the obstacle (0) or navigable (1) counters of the given cells, saturating at MAX_HITS
+    def add_hits(self, cells, hits, channel):
+        total = self.counts[cells, channel] + hits.astype(np.uint32)
+        self.counts[cells, channel] = np.minimum(total, MAX_HITS)
+
+    #Incrementally update the grid with one frame of perception results. Only the cells touched
+    #this frame are re-evaluated, so the cost scales with the number of observed pixels, not the
+    #map area. Obstacles, navigable terrain and rocks are each given as an (x world, y world) pair
+    #of arrays. Returns the sorted flat indices of the cells that were re-evaluated or flagged as rocks.
+    def update(self, obstacles, navigable, rocks):
+        #count how many times we have seen an obstacle (0) at an XY position VS. navigable terrain (1)
+        obstacle_cells, obstacle_hits = cell_hits(obstacles[0], obstacles[1], self.world_size)
+        navigable_cells, navigable_hits = cell_hits(navigable[0], navigable[1], self.world_size)
+        self.add_hits(obstacle_cells, obstacle_hits, 0)
+        self.add_hits(navigable_cells, navigable_hits, 1)
+
+        #re-evaluate only the touched cells that are not already rocks
+        touched = np.union1d(obstacle_cells, navigable_cells)
+        touched = touched[~self.is_rock(touched)]
+        obstacle_count = self.counts[touched, 0]
+        navigable_count = self.counts[touched, 1]
+
+        #if we have seen more obstacles than naviagable terrain at a position it is an obstacle,
+        #if we have seen more navigable terrain it is navigable, otherwise it is left as it was
+        self.state[touched[obstacle_count > navigable_count]] = OBSTACLE_CELL
+        self.state[touched[navigable_count > obstacle_count]] = NAVIGABLE_CELL
+
+        rock_cells = cells_of(rocks[0], rocks[1], self.world_size)
+        self.set_rocks(rock_cells)
+
+        return np.union1d(touched, rock_cells)
+
+    #the state (UNKNOWN, OBSTACLE_CELL, NAVIGABLE_CELL or ROCK_CELL) of each of the given flat cell indices
+    def cell_states(self, cells):
+        states = self.state[cells]
+        states[self.is_rock(cells)] = ROCK_CELL
+        return states
+
+    #the rock layer unpacked to one boolean per cell, in (y, x) map layout
+    def rock_map(self):
+        n_cells = self.world_size * self.world_size
+        return np.unpackbits(self.rock_bits)[:n_cells].astype(bool).reshape(self.world_size, self.world_size)
+
+    #render the grid as a (world_size, world_size, 3) uint8 RGB world map, or only its top left
+    #(height, width) extent if one is given
+    def render(self, extent=None):
+        height, width = extent or (self.world_size, self.world_size)
+        worldmap = STATE_COLORS[self.state.reshape(self.world_size, self.world_size)[:height, :width]]
+        worldmap[self.rock_map()[:height, :width]] = ROCK_COLOR
+        return worldmap
+
+#Sparse world map made of fixed size OccupancyGrid tiles that are only allocated once the rover
+#sees a cell inside them, so memory and per-frame update cost scale with the explored area instead
+#of the (configurable) world_size x world_size bounding box. Has the same update/render interface
+#as OccupancyGrid, with cells addressed in world coordinates.
+class TiledOccupancyGrid():
+    def __init__(self, world_size=200, tile_size=32):
+        self.world_size = world_size
+        self.tile_size = tile_size
+        self.tiles_per_row = -(-world_size // tile_size)
+        self.tiles = {} #tile index -> OccupancyGrid, allocated lazily
+        self.dirty_tiles = set() #tiles changed since the last render
+        self.rendered = None #RGB world map of the last rendered extent, repainted tile by tile in render()
+
+    #the tile index and in-tile coordinates of a set of world coordinates
+    def split(self, x_world, y_world):
+        x_world = np.asarray(x_world, dtype=np.intp)
+        y_world = np.asarray(y_world, dtype=np.intp)
+        tile_index = (y_world // self.tile_size) * self.tiles_per_row + (x_world // self.tile_size)
+        return tile_index, x_world % self.tile_size, y_world % self.tile_size
+
+    #the tile with the given index, allocating it the first time it is needed
+    def tile(self, tile_index):
+        if tile_index not in self.tiles:
+            self.tiles[tile_index] = OccupancyGrid(self.tile_size)
+        return self.tiles[tile_index]
+
+    #world map origin (x, y) of a tile
+    def tile_origin(self, tile_index):
+        return (tile_index % self.tiles_per_row) * self.tile_size, (tile_index // self.tiles_per_row) * self.tile_size
+
+    #Update the tiles seen this frame with one frame of perception results (see OccupancyGrid.update).
+    #Returns the flat world map indices of the cells that were re-evaluated or flagged as rocks.
+    def update(self, obstacles, navigable, rocks):
+        split = [self.split(x_world, y_world) for x_world, y_world in (obstacles, navigable, rocks)]
+        touched = []
+        for tile_index in np.unique(np.concatenate([tile_indices for tile_indices, _, _ in split])):
+            local = []
+            for tile_indices, x_local, y_local in split:
+                in_tile = tile_indices == tile_index
+                local.append((x_local[in_tile], y_local[in_tile]))
+            tile_touched = self.tile(tile_index).update(*local)
+            self.dirty_tiles.add(tile_index)
+
+            #convert the touched cells back to world map cell indices
+            x0, y0 = self.tile_origin(tile_index)
+            touched.append(cells_of(x0 + tile_touched % self.tile_size, y0 + tile_touched // self.tile_size, self.world_size))
+
+        if not touched:
+            return np.zeros(0, dtype=np.intp)
+        return np.concatenate(touched)
+
+    #the state (UNKNOWN, OBSTACLE_CELL, NAVIGABLE_CELL or ROCK_CELL) of each of the given flat
+    #world map cell indices; cells in tiles that have not been allocated yet are UNKNOWN
+    def cell_states(self, cells):
+        tile_indices, x_local, y_local = self.split(cells % self.world_size, cells // self.world_size)
+        states = np.full(len(cells), UNKNOWN, dtype=np.uint8)
+        for tile_index in np.unique(tile_indices):
+            if tile_index in self.tiles:
+                in_tile = tile_indices == tile_index
+                local_cells = y_local[in_tile] * self.tile_size + x_local[in_tile]
+                states[in_tile] = self.tiles[tile_index].cell_states(local_cells)
+        return states
+
+    #Render the map as a (world_size, world_size, 3) uint8 RGB world map, or only its top left
+    #(height, width) extent if one is given. The rendered extent is kept from one render to the
+    #next and only the tiles inside it that changed since are repainted, so the cost and memory
+    #scale with the extent instead of the world size. Returns a copy of the extent
+    def render(self, extent=None):
+        height, width = extent or (self.world_size, self.world_size)
+        height, width = min(height, self.world_size), min(width, self.world_size)
+        if self.rendered is None or self.rendered.shape[:2] != (height, width):
+            #a new extent: paint every allocated tile inside it
+            self.rendered = np.zeros((height, width, 3), dtype=np.uint8)
+            self.dirty_tiles = set(self.tiles)
+        for tile_index in self.dirty_tiles:
+            x0, y0 = self.tile_origin(tile_index)
+            if x0 >= width or y0 >= height:
+                continue
+            tile_height = min(self.tile_size, height - y0)
+            tile_width = min(self.tile_size, width - x0)
+            self.rendered[y0:y0+tile_height, x0:x0+tile_width] = self.tiles[tile_index].render((tile_height, tile_width))
+        self.dirty_tiles.clear()
+        return self.rendered.copy()
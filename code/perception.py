@@ -1,6 +1,13 @@
 import numpy as np
 import cv2
 
+from probes import probe
+from workspace import FrameWorkspace
+from world_transform import WorldTransform
+from calibration import RegionOfInterest
+from rock_detection import detect_rocks, rock_cells
+
+
 #threshold a black and white image - used to filter out walls from navigable path for the rover
 #returns 3 channel image such that it can be transformed properly
 def bw_thresh(img, bw_threshold_value = 160):
@@ -63,55 +70,36 @@ def to_polar_coords(x_pixel, y_pixel):
     return dist, angles
 
 # Define a function to map rover space pixels to world space
-def rotate_pix(xpix, ypix, yaw):
-    # Convert yaw to radians
-    yaw_rad = yaw * np.pi / 180
-    xpix_rotated = (xpix * np.cos(yaw_rad)) - (ypix * np.sin(yaw_rad))
-                            
-    ypix_rotated = (xpix * np.sin(yaw_rad)) + (ypix * np.cos(yaw_rad))
-    # Return the result  
-    return xpix_rotated, ypix_rotated
-
-def translate_pix(xpix_rot, ypix_rot, xpos, ypos, scale): 
-    # Apply a scaling and a translation
-    xpix_translated = (xpix_rot / scale) + xpos
-    ypix_translated = (ypix_rot / scale) + ypos
-    # Return the result  
-    return xpix_translated, ypix_translated
-
-
-# Define a function to apply rotation and translation (and clipping)
-# Once you define the two functions above this function should work
+#the rotation, scaling, translation and clipping are done all at once by a single float32
+#world transform (see world_transform.WorldTransform)
 def pix_to_world(xpix, ypix, xpos, ypos, yaw, world_size, scale):
-    # Apply rotation
-    xpix_rot, ypix_rot = rotate_pix(xpix, ypix, yaw)
-    # Apply translation
-    xpix_tran, ypix_tran = translate_pix(xpix_rot, ypix_rot, xpos, ypos, scale)
-    # Perform rotation, translation and clipping all at once
-    x_pix_world = np.clip(np.int_(xpix_tran), 0, world_size - 1)
-    y_pix_world = np.clip(np.int_(ypix_tran), 0, world_size - 1)
+    world_xy = WorldTransform(xpos, ypos, yaw, scale, world_size).apply(np.stack((xpix, ypix), axis=1))
     # Return the result
-    return x_pix_world, y_pix_world
+    return world_xy[:, 0], world_xy[:, 1]
 
 # Define a function to perform a perspective transform
-def perspect_transform(img, src, dst):
+#img can be the region of interest view of a camera image (see calibration.RegionOfInterest),
+#src are camera image points either way. dsize is the (width, height) of the top down image,
+#the size of the input image by default
+def perspect_transform(img, src, dst, roi=None, dsize=None):
            
     M = cv2.getPerspectiveTransform(src, dst)
-    warped = cv2.warpPerspective(img, M, (img.shape[1], img.shape[0]))# keep same size as input image
+    if roi is not None:
+        M = M.dot(roi.view_to_camera())
+    warped = cv2.warpPerspective(img, M, dsize or (img.shape[1], img.shape[0]))# keep same size as input image
     
     return warped
 
 #takes a picture in from the rover's perspective and
 #returns rock coordinates in the world view perspective
-def get_rock_world_coordinates(img, source, destination,xpos,ypos,yaw,world_size,scale):
-    #copy input image
-    rover_perspect = np.copy(img)
-    #cut out the sky
-    rover_perspect= cut_top_of_colored_image(rover_perspect)
+def get_rock_world_coordinates(img, source, destination,xpos,ypos,yaw,world_size,scale,roi=None):
+    #look at the region of interest only (this cuts out the sky)
+    roi = roi or RegionOfInterest()
+    rover_perspect = roi.view(img)
     #threshold the image for rocks
     threshed = rock_thresh(rover_perspect)
     #convert this into top down pixel perspective
-    top_down = perspect_transform(threshed, source, destination)
+    top_down = perspect_transform(threshed, source, destination, roi, (img.shape[1], img.shape[0]))
 
     #convert to one channel image
     top_down = top_down[:,:,0]
@@ -138,19 +126,12 @@ def get_rock_world_coordinates(img, source, destination,xpos,ypos,yaw,world_size
     
     return x_pix_world,y_pix_world,dist, angles
 
-#cuts off the top of a colored image. Can be used to cut out the sky
-#from most of the perception analysis
-def cut_top_of_colored_image(img, pixels_to_cut=60):
-    cut_img = np.copy(img)
-    cut_img[:pixels_to_cut,:] = [0,0,0]
-    return cut_img
-
-
 #given an image taken from the rover's perspective,
 #return the position of obstacles in the world-view perspective
-def get_obstacle_world_coordinates(img, source, destination,xpos,ypos,yaw,world_size,scale):
-    #threshold the image for navigable terrain
-    threshed = bw_thresh(img)
+def get_obstacle_world_coordinates(img, source, destination,xpos,ypos,yaw,world_size,scale,roi=None):
+    #threshold the region of interest of the image for navigable terrain
+    roi = roi or RegionOfInterest()
+    threshed = bw_thresh(roi.view(img))
 
     #change to a top-down perspective
     #warped = perspect_transform(threshed, source, destination)
@@ -166,20 +147,20 @@ def get_obstacle_world_coordinates(img, source, destination,xpos,ypos,yaw,world_
     threshed[mask]=0
 
     #cahange to a top down perspective
-    threshed = perspect_transform(threshed, source, destination)
+    threshed = perspect_transform(threshed, source, destination, roi, (img.shape[1], img.shape[0]))
 
     #get rover-centric coordiantes of these obstacles
     xpix, ypix = rover_coords(threshed)
 
     #anything further away than 80 consider to be innaccurate and neglect
-    pix_mask = xpix**2+ypix**2 >= 80**2
-    xpix[pix_mask] = 0
-    ypix[pix_mask] = 0
+    pix_mask = xpix**2+ypix**2 < 80**2
+    xpix=xpix[pix_mask]
+    ypix=ypix[pix_mask]
     
     #filter out values with angles outside of 30deg
-    pix_mask = (np.arctan2(ypix,xpix)*180/np.pi)**2 > 30**2
-    xpix[pix_mask] = 0
-    ypix[pix_mask] = 0
+    pix_mask = (np.arctan2(ypix,xpix)*180/np.pi)**2 <= 30**2
+    xpix=xpix[pix_mask]
+    ypix=ypix[pix_mask]
 
     #get the polar values
     dist, angles= to_polar_coords(xpix, ypix)
@@ -188,11 +169,12 @@ def get_obstacle_world_coordinates(img, source, destination,xpos,ypos,yaw,world_
     xpix_w, ypix_w = pix_to_world(xpix,ypix,xpos,ypos,yaw,world_size,scale)
     return xpix_w, ypix_w ,dist, angles
 
-def get_navigible_terrain_world_coordinates(img, source, destination,xpos,ypos,yaw,world_size,scale):
-    #threshold the image for navigable terrain
-    threshed = bw_thresh(cut_top_of_colored_image(img))
+def get_navigible_terrain_world_coordinates(img, source, destination,xpos,ypos,yaw,world_size,scale,roi=None):
+    #threshold the region of interest of the image (no sky) for navigable terrain
+    roi = roi or RegionOfInterest()
+    threshed = bw_thresh(roi.view(img))
     #change to a top-down perspective
-    warped = perspect_transform(threshed, source, destination)
+    warped = perspect_transform(threshed, source, destination, roi, (img.shape[1], img.shape[0]))
 
     #convert to one channel images
     warped = warped[:,:,0]
@@ -202,14 +184,14 @@ def get_navigible_terrain_world_coordinates(img, source, destination,xpos,ypos,y
     xpix, ypix = rover_coords(warped)
     
     #anything further away than 80 consider to be innaccurate and neglect
-    pix_mask = xpix**2+ypix**2 >= 80**2
-    xpix[pix_mask] = 0
-    ypix[pix_mask] = 0
+    pix_mask = xpix**2+ypix**2 < 80**2
+    xpix=xpix[pix_mask]
+    ypix=ypix[pix_mask]
     
     #filter distances angles outside of 30deg
-    pix_mask = (np.arctan2(ypix,xpix)*180/np.pi)**2 > 30**2
-    xpix[pix_mask] = 0
-    ypix[pix_mask] = 0
+    pix_mask = (np.arctan2(ypix,xpix)*180/np.pi)**2 <= 30**2
+    xpix=xpix[pix_mask]
+    ypix=ypix[pix_mask]
     xpix_w, ypix_w = pix_to_world(xpix,ypix,xpos,ypos,yaw,world_size,scale)
 
     #get polar coordinate rover centric navigable terrain distances and angles
@@ -218,24 +200,94 @@ def get_navigible_terrain_world_coordinates(img, source, destination,xpos,ypos,y
     return xpix_w, ypix_w, dist, angles
 
 
+#label flags for the fused perception path - each camera pixel is classified once
+#into a compact label image, which is warped once and shared by every perception path
+NAVIGABLE = 1
+OBSTACLE = 2
+ROCK = 4
+
+#classify every pixel of a rover camera image into a uint8 label image of
+#NAVIGABLE/OBSTACLE/ROCK flags (0 is ignored). Matches the combined behaviour of
+#bw_thresh and rock_thresh with the top `pixels_to_cut` rows (the sky) cut. Given a region of
+#interest view, pixels_to_cut counts the rows of the view (see RegionOfInterest.rows_to_cut)
+def classify_pixels(img, pixels_to_cut=60, bw_threshold_value=160, rock_bw_threshold_value=90, rock_saturation=100, workspace=None):
+    #every intermediate, and the returned label image, lives in the workspace buffers
+    if workspace is None:
+        workspace = FrameWorkspace(img.shape)
+    labels = workspace.labels
+
+    #a single grayscale conversion is shared by the navigable, obstacle and rock thresholds
+    img_bw = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY, dst=workspace.gray)
+    bright = np.greater_equal(img_bw, bw_threshold_value, out=workspace.bright)
+
+    #obstacles are everything not bright enough to be navigable (the sky is not cut here)
+    labels.fill(OBSTACLE)
+    np.copyto(labels, NAVIGABLE, where=bright)
+    #navigable terrain and rocks never come from the sky
+    np.copyto(labels[:pixels_to_cut], 0, where=bright[:pixels_to_cut])
+
+    #rocks are saturated pixels that are not dark walls
+    saturation = cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=workspace.hsv)[:,:,1]
+    rocks = np.greater(saturation, rock_saturation, out=workspace.rocks)
+    rocks &= np.greater_equal(img_bw, rock_bw_threshold_value, out=workspace.scratch)
+    rocks[:pixels_to_cut] = False
+    np.bitwise_or(labels, ROCK, out=labels, where=rocks)
+
+    return labels
+
+#fused single pass perception: classify the image once and gather the label flags into the
+#precomputed calibration tables (see calibration.CameraCalibration) instead of warping the image.
+#Returns the (x world, y world, distances, angles) of the navigable terrain, rocks and obstacles
+#in the same form as the get_*_world_coordinates functions. With a workspace (see
+#workspace.FrameWorkspace) no per-frame arrays are allocated and the returned arrays are views
+#into its buffers, valid until the workspace is used for the next frame
+def get_world_coordinates(img, calibration, xpos, ypos, yaw, world_size, scale, workspace=None):
+    if workspace is None:
+        workspace = FrameWorkspace(calibration.roi_shape, calibration)
+    #only the region of interest of the image is classified (a view, the sky is left out)
+    roi = calibration.roi
+    with probe('perception.classify'):
+        labels = classify_pixels(roi.view(img), pixels_to_cut=roi.rows_to_cut(60), workspace=workspace)
+    #only the pixels within the range/angle windows are carried through to the world map,
+    #so only their flags are gathered (in the same top down order as calibration.gather)
+    with probe('perception.gather'):
+        #(mode='clip' lets np.take write straight into its output, the indices are always valid)
+        flags = np.take(labels.ravel(), workspace.window_src_index, out=workspace.flags, mode='clip')
+    windows = ((NAVIGABLE, workspace.window_terrain),
+               (ROCK, workspace.window_rock),
+               (OBSTACLE, workspace.window_terrain))
+
+    results = []
+    with probe('perception.to_world'):
+        #one transform for the three pixel sets of the frame
+        transform = workspace.transform = WorldTransform(xpos, ypos, yaw, scale, world_size)
+        for (flag, window), mask, buffers in zip(windows, workspace.masks, workspace.pixel_sets):
+            np.bitwise_and(flags, flag, out=workspace.flag_bits)
+            np.not_equal(workspace.flag_bits, 0, out=mask)
+            mask &= window
+            #the one small per-frame allocation left: the indices of the set's pixels
+            pixels = buffers.window_pixels = np.flatnonzero(mask)
+            n_pixels = len(pixels)
+            rover_xy = np.take(workspace.window_rover_xy, pixels, axis=0, out=workspace.rover_xy[:n_pixels], mode='clip')
+            world_xy = transform.apply(rover_xy, out=buffers.world_xy[:n_pixels], scratch=workspace.world_scratch[:n_pixels])
+            x_pix_world, y_pix_world = world_xy[:, 0], world_xy[:, 1]
+            dist = np.take(workspace.window_dist, pixels, out=buffers.dist[:n_pixels], mode='clip')
+            angles = np.take(workspace.window_angles, pixels, out=buffers.angles[:n_pixels], mode='clip')
+            results.append((x_pix_world, y_pix_world, dist, angles))
+
+    navigable, rocks, obstacles = results
+    return navigable, rocks, obstacles
+
+
 #sets the Rover boolean value Rover.wall_on_left depending on
 #if there are enough (threshold dependent) obstacles at an angle greater than
-#10 degrees to the left of the rover
-def wall_on_left_set(obstacles_rover_polar_angles, Rover):
-    #get the obstacles to the left of the rover (more than 10 degrees)
-    wall_on_left_mask = obstacles_rover_polar_angles*180/np.pi > 10
-
-    #count them
-    wall_count = np.zeros_like(wall_on_left_mask)
-    wall_count[wall_on_left_mask] = 1
-    Rover.wall_left_amount = np.count_nonzero(wall_count)
+#10 degrees to the left of the rover, read from the polar histogram of the frame
+def wall_on_left_set(Rover):
+    Rover.wall_left_amount = Rover.polar.obstacles_left_of(10)
 
     #if greater than threshold, then there is a wall on the left of the rover
-    if np.count_nonzero(wall_count) > Rover.wall_on_left_threshold_pix:
-        Rover.wall_on_left = True
-    else:
-        Rover.wall_on_left = False
-    
+    Rover.wall_on_left = Rover.wall_left_amount > Rover.wall_on_left_threshold_pix
+
 
 def perception_step(Rover):
     # Perform perception steps to update Rover()
@@ -243,104 +295,50 @@ def perception_step(Rover):
     #get the rovers input image
     img = Rover.img
 
-    #
-    #Set perspective transform values
-    #
-    
-    dst_size = 10 #perspective transform scale
-    bottom_offset = 6 #perspective transform offset
-
-    #perspecive transform grid corner source
-    source = np.float32([[6.7,145.5], 
-                         [306.1, 142.7],
-                         [ 197.7, 96.8], 
-                         [118.2, 96.7]])
-   
-    #perspecive transform grid corner destination
-     #map rover perspective to bottom middle of top down view:
-    img_w = img.shape[1]
-    img_h = img.shape[0]
-    destination = np.float32([[img_w/2 - dst_size/2, img_h - bottom_offset],
-                  [img_w/2 + dst_size/2, img_h - bottom_offset],
-                  [img_w/2 + dst_size/2, img_h - dst_size - bottom_offset], 
-                  [img_w/2 - dst_size/2, img_h - dst_size - bottom_offset],
-                  ])
-
-
-    #percieve navigable terrain data in xy-world/polar-rover-centric coordiantes
-    navigable_x_world,navigable_y_world, \
-    rover_centric_pixel_distances, \
-    rover_centric_angles =  \
-            get_navigible_terrain_world_coordinates(np.copy(img),\
-                                                          source, \
-                                                          destination,\
-                                                          Rover.pos[0],\
-                                                          Rover.pos[1],\
-                                                          Rover.yaw,\
-                                                          200,\
-                                                          10)
-    
-    #percieve rock data in xy-world coordinates
-    rock_x_world, \
-    rock_y_world, \
-    Rover.rock_distances, \
-    Rover.rock_angles = get_rock_world_coordinates(np.copy(img),\
-                                                          source, \
-                                                          destination,\
-                                                          Rover.pos[0],\
-                                                          Rover.pos[1],\
-                                                          Rover.yaw,\
-                                                          200,\
-                                                          10)
-    
-    #percieve obstacle data in xy-world/polar-rover-centric coordiantes
-    obstacle_x_world, \
-    obstacle_y_world, \
-    dist_obstacles_rover,\
-    angles_obstacles_rover = \
-        get_obstacle_world_coordinates(np.copy(img),\
-                                          source, \
-                                          destination,\
-                                          Rover.pos[0],\
-                                          Rover.pos[1],\
-                                          Rover.yaw,\
-                                          200,\
-                                          10)
+    #percieve navigable terrain, rock and obstacle data in xy-world/polar-rover-centric
+    #coordinates with a single fused pass over the image
+    navigable, rocks, obstacles = get_world_coordinates(img,\
+                                                        Rover.calibration,\
+                                                        Rover.pos[0],\
+                                                        Rover.pos[1],\
+                                                        Rover.yaw,\
+                                                        Rover.world_size,\
+                                                        10,\
+                                                        Rover.workspace)
+
+    navigable_x_world, navigable_y_world, _, _ = navigable
+    obstacle_x_world, obstacle_y_world, _, _ = obstacles
+    workspace = Rover.workspace
+    nav_set, rock_set, obstacle_set = workspace.pixel_sets
+
+    #summarize the navigable terrain and obstacles in view per angle sector; this fixed size
+    #histogram, not the pixels, is what the decision step works from
+    with probe('perception.polar'):
+        Rover.polar.update(nav_set.window_pixels, obstacle_set.window_pixels,
+                           workspace.window_dist, workspace.window_angles)
+
+    #group the rock pixels into rock objects; only the rocks are carried on from here.
+    #They are merged into the registry of the rocks seen so far, which links each to its entry
+    with probe('perception.rocks'):
+        Rover.rocks = detect_rocks(workspace.rocks, rock_set.window_pixels, workspace, workspace.transform)
+        Rover.rock_registry.add(Rover.rocks, Rover.total_time)
 
     #determine if there is a wall on the left of the rover
-    wall_on_left_set(angles_obstacles_rover, Rover)
+    wall_on_left_set(Rover)
 
     #
     #Build/Adjust world map
     #
 
-    #count how many times we have seen an obstacle (0) at an XY position VS. navigable terrain (1)
-    Rover.map_count[obstacle_y_world, obstacle_x_world, 0] += 1
-    Rover.map_count[navigable_y_world, navigable_x_world, 1] += 1
-
-    #if we have seen more obstacles than naviagable terrain at a position, set the world map as an obstacle
-    obstacle = (Rover.map_count[:, :, 0] > Rover.map_count[:, :, 1])  &  (Rover.worldmap[:, :, 1] < 1)
-    #otherwise set it as navigable
-    naviagable = (Rover.map_count[:, :, 1] > Rover.map_count[:, :, 0]) &  (Rover.worldmap[:, :, 1] < 1)
+    #count the obstacle/navigable hits and recolor the cells seen this frame;
+    #each rock flags the one cell of its base
+    with probe('map.update'):
+        changed_cells = Rover.occupancy.update((obstacle_x_world, obstacle_y_world),
+                                               (navigable_x_world, navigable_y_world),
+                                               rock_cells(Rover.rocks))
 
-    #Obstacles are red (255,0,0)
-    Rover.worldmap[obstacle, 0] = 255
-    Rover.worldmap[obstacle, 1] = 0
-    Rover.worldmap[obstacle, 2] = 0
+    #keep the map statistics up to date with the cells that changed
+    with probe('map.statistics'):
+        Rover.map_stats.update(Rover.occupancy, changed_cells)
 
-    #naviagable terrain is blue (0,0,255)
-    Rover.worldmap[naviagable, 0] = 0
-    Rover.worldmap[naviagable, 1] = 0
-    Rover.worldmap[naviagable, 2] = 255
-
-
-    #Rocks are green (0,255,0)
-    Rover.worldmap[rock_y_world, rock_x_world, 0] = 0
-    Rover.worldmap[rock_y_world, rock_x_world, 1] = 255
-    Rover.worldmap[rock_y_world, rock_x_world, 2] = 0
-    
-    #set the rover polar coordinate data to be used later in decision making
-    Rover.nav_dists = rover_centric_pixel_distances
-    Rover.nav_angles = rover_centric_angles
-    
     return Rover
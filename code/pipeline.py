@@ -0,0 +1,154 @@
+import threading
+
+import numpy as np
+
+from perception import perception_step
+from decision import decision_step
+from supporting_functions import update_rover, output_state, overlay_worldmap, encode_output_images
+from rover_log import log
+from probes import probe
+
+#Bounded handoff that holds at most one frame, between the socketio handler and the perception
+#worker, and between the perception and output workers. Putting a frame never blocks: a frame the
+#worker has not picked up yet is replaced by the newer one (latest frame wins), so a slow frame
+#never backs up the stage feeding it.
+class LatestFrameSlot():
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.closed = False
+        self.dropped = 0 #frames replaced before the worker got to them
+
+    def put(self, frame):
+        with self.condition:
+            if self.frame is not None:
+                self.dropped += 1
+            self.frame = frame
+            self.condition.notify()
+
+    #wait for the next frame; returns None once the slot is closed
+    def take(self):
+        with self.condition:
+            while self.frame is None and not self.closed:
+                self.condition.wait()
+            frame = self.frame
+            self.frame = None
+            return frame
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+#Pipelined execution mode for drive_rover.py. The telemetry handler only submits the frame and
+#answers with the freshest control command available. Decoding, perception/map update and
+#decision run on the perception worker thread, which publishes the control command of a frame as
+#soon as its decision is made. Output rendering runs on its own output worker thread, handed the
+#latest frame's map statistics through a second latest-wins slot, so a rendering spike never
+#delays the next frame's perception and decision: the output images are just skipped for the
+#frames that arrive during it. The map is only read by the output worker under map_lock, which the
+#perception worker holds while it updates the map.
+class PerceptionPipeline():
+    def __init__(self, Rover):
+        self.Rover = Rover
+        self.frames = LatestFrameSlot()
+        self.outputs = LatestFrameSlot() #output_state of the latest frame to render
+        self.map_lock = threading.Lock() #held while the map is updated or rendered
+        self.lock = threading.Lock()
+        self.commands = None #(throttle, brake, steer) of the latest processed frame
+        self.images = ('', '') #the latest output images
+        self.pickup_pending = False #a pickup command waiting to be sent (once)
+        self.frames_processed = 0
+        self.thread = threading.Thread(target=self.run, name='perception', daemon=True)
+        self.output_thread = threading.Thread(target=self.run_output, name='output', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.output_thread.start()
+
+    def stop(self):
+        self.frames.close()
+        self.thread.join()
+        self.outputs.close()
+        self.output_thread.join()
+
+    #hand a telemetry frame to the worker, replacing any frame it has not started yet
+    def submit(self, data):
+        self.frames.put(data)
+
+    #The reply to send to the simulator now: ('pickup', None) if a pickup command is pending,
+    #('control', (commands, image_string1, image_string2)) with the freshest command otherwise,
+    #or None if no frame has been processed yet
+    def reply(self):
+        with self.lock:
+            if self.pickup_pending:
+                self.pickup_pending = False
+                return 'pickup', None
+            if self.commands is None:
+                return None
+            return 'control', (self.commands,) + self.images
+
+    def run(self):
+        while True:
+            data = self.frames.take()
+            if data is None:
+                break
+            try:
+                self.process(data)
+            except Exception:
+                log.exception('Perception pipeline failed to process a frame')
+
+    def run_output(self):
+        while True:
+            state = self.outputs.take()
+            if state is None:
+                break
+            try:
+                self.render(state)
+            except Exception:
+                log.exception('Perception pipeline failed to render the output images')
+
+    #run the perception and decision stages for one telemetry frame
+    def process(self, data):
+        Rover = update_rover(self.Rover, data)
+
+        if not np.isfinite(Rover.vel):
+            # In case of invalid telemetry, send null commands and empty images
+            self.publish((0, 0, 0), False, ('', ''))
+            return
+
+        with probe('perception'), self.map_lock:
+            Rover = perception_step(Rover)
+        with probe('decision'):
+            Rover = decision_step(Rover)
+
+        # If in a state where want to pickup a rock send pickup command
+        pickup = Rover.send_pickup and not Rover.picking_up
+        if pickup:
+            # Reset Rover flags
+            Rover.send_pickup = False
+        self.publish((Rover.throttle, Rover.brake, Rover.steer), pickup)
+
+        # Hand the frame's map statistics to the output worker
+        self.outputs.put(output_state(Rover))
+
+    #render the output images for one frame's output_state (on the output worker)
+    def render(self, state):
+        Rover = self.Rover
+        with probe('output'):
+            with self.map_lock:
+                map_add, samples_located = overlay_worldmap(Rover.occupancy, Rover.map_stats, Rover.samples_pos)
+            images = encode_output_images(map_add, samples_located, state, Rover.vision_image)
+        self.publish_images(images)
+
+    def publish(self, commands, pickup, images=None):
+        with self.lock:
+            self.commands = commands
+            self.pickup_pending = self.pickup_pending or pickup
+            if images is not None:
+                self.images = images
+            self.frames_processed += 1
+
+    def publish_images(self, images):
+        with self.lock:
+            self.images = images
@@ -0,0 +1,62 @@
+import numpy as np
+
+#Polar sector histogram of the navigable terrain and obstacles in view (in the spirit of a vector
+#field histogram), the summary of a frame that perception publishes for the decision step.
+#The +-max_angle degree field of view is split into n_sectors angle sectors. The sector of each
+#window pixel of a FrameWorkspace is looked up once here, so each frame is binned by a few
+#np.bincount passes over the pixel sets get_world_coordinates found, giving per sector pixel
+#counts, distance sums and angle sums, and the whole view totals are worked out from them once.
+#The decision step then only ever looks at these fixed size arrays and totals, so its cost does
+#not depend on how many pixels are in view.
+class PolarHistogram():
+    def __init__(self, window_angles, n_sectors=30, max_angle=30):
+        self.n_sectors = n_sectors
+        self.edges = np.linspace(-max_angle, max_angle, n_sectors + 1) #sector edges in degrees
+        #the sector of every window pixel; the pixels right on the +-max_angle edges are kept
+        degrees = window_angles * 180/np.pi
+        self.window_sector = np.clip(np.searchsorted(self.edges, degrees, side='right') - 1, 0, n_sectors - 1)
+
+        self.valid = False #set once a frame has been binned
+        self.nav_counts = np.zeros(n_sectors, dtype=np.int_) #navigable pixels per sector
+        self.nav_dist_sum = np.zeros(n_sectors) #sum of the distances of the navigable pixels
+        self.nav_angle_sum = np.zeros(n_sectors) #sum of the angles (radians) of the navigable pixels
+        self.obstacle_counts = np.zeros(n_sectors, dtype=np.int_) #obstacle pixels per sector
+        self.obstacle_dist_sum = np.zeros(n_sectors) #sum of the distances of the obstacle pixels
+        #whole field of view totals, computed once per frame
+        self.nav_total = 0 #number of navigable pixels in view
+        self.nav_mean_dist = 0.0 #mean distance of the navigable pixels in view (0 if there are none)
+        self.nav_mean_angle = 0.0 #mean angle (radians) of the navigable pixels in view (0 if there are none)
+
+    #Bin a frame. navigable and obstacles are the indices into the window tables of the navigable
+    #and obstacle pixels (PixelSetBuffers.window_pixels), window_dist and window_angles the
+    #distances and angles of the window pixels (FrameWorkspace.window_dist and window_angles)
+    def update(self, navigable, obstacles, window_dist, window_angles):
+        n_sectors = self.n_sectors
+        sector = self.window_sector[navigable]
+        self.nav_counts = np.bincount(sector, minlength=n_sectors)
+        self.nav_dist_sum = np.bincount(sector, window_dist[navigable], minlength=n_sectors)
+        self.nav_angle_sum = np.bincount(sector, window_angles[navigable], minlength=n_sectors)
+        sector = self.window_sector[obstacles]
+        self.obstacle_counts = np.bincount(sector, minlength=n_sectors)
+        self.obstacle_dist_sum = np.bincount(sector, window_dist[obstacles], minlength=n_sectors)
+
+        self.nav_total = len(navigable)
+        if self.nav_total > 0:
+            self.nav_mean_dist = float(self.nav_dist_sum.sum()) / self.nav_total
+            self.nav_mean_angle = float(self.nav_angle_sum.sum()) / self.nav_total
+        else:
+            self.nav_mean_dist = self.nav_mean_angle = 0.0
+        self.valid = True
+
+    #mean distance of the navigable pixels of each sector (0 for the empty sectors)
+    def nav_sector_dists(self):
+        return self.nav_dist_sum / np.maximum(self.nav_counts, 1)
+
+    #mean distance of the obstacle pixels of each sector (0 for the empty sectors)
+    def obstacle_sector_dists(self):
+        return self.obstacle_dist_sum / np.maximum(self.obstacle_counts, 1)
+
+    #number of obstacle pixels more than `degrees` to the left of the rover
+    #(degrees should be one of the sector edges)
+    def obstacles_left_of(self, degrees):
+        return int(self.obstacle_counts[np.searchsorted(self.edges, degrees):].sum())
@@ -0,0 +1,118 @@
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+#Timing probes for the frame loop hot path.
+#A stage is timed by wrapping it in a probe:
+#
+#  with probe('decode'):
+#      ...
+#
+#Every stage keeps lifetime counters and a rolling window of its latest timings, summarized
+#(percentiles and a latency histogram) by metrics(), which drive_rover.py serves on its /metrics
+#endpoint. Probes are disabled by default: probe() then returns a shared no-op context manager,
+#so a disabled probe costs one function call and a flag check. Enable them with
+#enable_probes(), the drive_rover.py --probes option or the ROVER_PROBES=1 environment variable.
+
+#upper edges (ms) of the latency histogram buckets, the last bucket holds everything slower
+BUCKET_EDGES_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250)
+
+#Lifetime counters and a rolling window of the latest `window` timings of a stage
+class StageHistogram():
+    def __init__(self, window=1024):
+        self.lock = threading.Lock()
+        self.recent = collections.deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        with self.lock:
+            self.recent.append(seconds)
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    #counters and the rolling window statistics, in milliseconds
+    def summary(self):
+        with self.lock:
+            recent = 1000 * np.array(self.recent)
+            count, total, slowest = self.count, self.total, self.max
+        summary = {'count': count, 'total_ms': 1000 * total, 'max_ms': 1000 * slowest,
+                   'window': len(recent)}
+        if len(recent):
+            buckets = np.bincount(np.searchsorted(BUCKET_EDGES_MS, recent), minlength=len(BUCKET_EDGES_MS) + 1)
+            summary.update({'mean_ms': float(recent.mean()), 'p50_ms': float(np.percentile(recent, 50)),
+                            'p90_ms': float(np.percentile(recent, 90)), 'p99_ms': float(np.percentile(recent, 99)),
+                            'histogram': {'le_{}'.format(edge): int(n) for edge, n in zip(BUCKET_EDGES_MS, buckets)}})
+            summary['histogram']['le_inf'] = int(buckets[-1])
+        return summary
+
+#times one run of a stage
+class _Probe():
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+class _NullProbe():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_PROBE = _NullProbe()
+_enabled = os.environ.get('ROVER_PROBES', '0').lower() not in ('', '0', 'false', 'no', 'off')
+_window = 1024
+_stages = {}
+_stages_lock = threading.Lock()
+
+#context manager timing the stage `name` (a no-op while the probes are disabled)
+def probe(name):
+    if not _enabled:
+        return _NULL_PROBE
+    histogram = _stages.get(name)
+    if histogram is None:
+        with _stages_lock:
+            histogram = _stages.setdefault(name, StageHistogram(_window))
+    return _Probe(histogram)
+
+#turn the probes on, keeping the latest `window` timings of every stage
+def enable_probes(window=1024):
+    global _enabled, _window
+    _window = window
+    _enabled = True
+
+def disable_probes():
+    global _enabled
+    _enabled = False
+
+def probes_enabled():
+    return _enabled
+
+#forget all the timings recorded so far
+def reset_probes():
+    with _stages_lock:
+        _stages.clear()
+
+#the summary of every stage timed so far, by stage name
+def metrics():
+    with _stages_lock:
+        stages = dict(_stages)
+    return {'enabled': _enabled,
+            'stages': {name: stages[name].summary() for name in sorted(stages)}}
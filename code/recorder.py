@@ -0,0 +1,132 @@
+import base64
+import collections
+import json
+import struct
+import threading
+import time
+
+from rover_log import log
+
+#Run recordings are stored in a single append-only container file instead of one image file per
+#frame. The file starts with MAGIC and is followed by one record per frame:
+#
+#  <uint32 telemetry length> <uint32 jpeg length> <telemetry JSON (utf-8)> <jpeg bytes>
+#
+#The telemetry JSON holds the time the frame was received and every telemetry field except the
+#image, exactly as the simulator sent them (position, yaw, pitch, roll, speed, ...). The jpeg is
+#the original camera frame, it is never re-encoded.
+MAGIC = b'ROVERREC1\n'
+RECORD_HEADER = struct.Struct('<II')
+
+#Records telemetry frames to a container file from a background writer thread. The frame loop
+#only appends the telemetry dictionary to an in-memory ring buffer; base64 decoding, JSON
+#encoding and disk I/O all happen on the writer thread. If the writer falls behind by more than
+#`capacity` frames the oldest frames are dropped (and counted) rather than blocking the loop.
+class FrameRecorder():
+    def __init__(self, path, capacity=256, flush_interval=1.0):
+        self.path = path
+        self.buffer = collections.deque(maxlen=capacity)
+        self.flush_interval = flush_interval
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.wake = threading.Event()
+        self.stopping = False
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.thread = threading.Thread(target=self.run, name='recorder', daemon=True)
+        self.thread.start()
+
+    #queue a telemetry frame for recording; never blocks
+    def record(self, data):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.frames_dropped += 1
+        self.buffer.append((time.time(), data))
+        self.wake.set()
+
+    #write out the queued frames and close the file
+    def close(self):
+        self.stopping = True
+        self.wake.set()
+        self.thread.join()
+        self.file.close()
+
+    def run(self):
+        last_flush = time.time()
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            while self.buffer:
+                received, data = self.buffer.popleft()
+                try:
+                    self.write(received, data)
+                except Exception:
+                    log.exception('Failed to record a telemetry frame')
+            if time.time() - last_flush >= self.flush_interval:
+                self.file.flush()
+                last_flush = time.time()
+            if self.stopping and not self.buffer:
+                break
+
+    def write(self, received, data):
+        telemetry = {key: value for key, value in data.items() if key != 'image'}
+        telemetry['time'] = received
+        telemetry = json.dumps(telemetry).encode('utf-8')
+        jpeg = base64.b64decode(data['image'])
+        self.file.write(RECORD_HEADER.pack(len(telemetry), len(jpeg)))
+        self.file.write(telemetry)
+        self.file.write(jpeg)
+        self.frames_written += 1
+
+#read the record at the current position of an open recording; returns None at the end of the
+#file (or at a record cut short by a crash)
+def _read_record(recording):
+    header = recording.read(RECORD_HEADER.size)
+    if len(header) < RECORD_HEADER.size:
+        return None
+    telemetry_length, jpeg_length = RECORD_HEADER.unpack(header)
+    telemetry = recording.read(telemetry_length)
+    jpeg = recording.read(jpeg_length)
+    if len(jpeg) < jpeg_length:
+        return None
+    return json.loads(telemetry.decode('utf-8')), jpeg
+
+def _open_recording(path):
+    recording = open(path, 'rb')
+    if recording.read(len(MAGIC)) != MAGIC:
+        recording.close()
+        raise ValueError('{} is not a rover recording'.format(path))
+    return recording
+
+#Iterate over the frames of a recording, yielding (telemetry dictionary, jpeg bytes) pairs.
+#The telemetry dictionary holds the recorded fields plus the 'time' the frame was received.
+def read_recording(path):
+    with _open_recording(path) as recording:
+        while True:
+            record = _read_record(recording)
+            if record is None:
+                return
+            yield record
+
+#The file offsets of the complete records of a recording, read from the record headers only,
+#so that the recording can be split up and read in parts with read_records
+def index_recording(path):
+    offsets = []
+    with _open_recording(path) as recording:
+        size = recording.seek(0, 2)
+        offset = len(MAGIC)
+        while offset + RECORD_HEADER.size <= size:
+            recording.seek(offset)
+            telemetry_length, jpeg_length = RECORD_HEADER.unpack(recording.read(RECORD_HEADER.size))
+            end = offset + RECORD_HEADER.size + telemetry_length + jpeg_length
+            if end > size:
+                break
+            offsets.append(offset)
+            offset = end
+    return offsets
+
+#the (telemetry dictionary, jpeg bytes) pairs of the records at the given offsets (see index_recording)
+def read_records(path, offsets):
+    with _open_recording(path) as recording:
+        for offset in offsets:
+            recording.seek(offset)
+            yield _read_record(recording)
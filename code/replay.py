@@ -0,0 +1,135 @@
+#Headless replay harness: drives a RoverState through update_rover -> perception_step ->
+#decision_step -> create_output_images over a recorded run as fast as the CPU allows, with no
+#simulator or socketio server, and reports frames/sec and per-stage timings.
+#
+#A run can be either
+#  - a recording made by drive_rover.py (a .rrec file, or the folder holding run.rrec), or
+#  - a folder recorded with the simulator's training mode (robot_log.csv plus its IMG folder)
+#
+#usage (from the code directory): python replay.py <recording> [--limit N] [--json results.json]
+import argparse
+import base64
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from perception import perception_step
+from decision import decision_step
+from rover_state import RoverState
+from supporting_functions import update_rover, create_output_images
+from recorder import read_recording
+
+STAGES = ('update_rover', 'perception_step', 'decision_step', 'create_output_images')
+
+#frames of a drive_rover.py recording as (telemetry data, time received) pairs
+def recorded_frames(path):
+    for telemetry, jpeg in read_recording(path):
+        data = dict(telemetry)
+        received = data.pop('time')
+        data['image'] = base64.b64encode(jpeg).decode('utf-8')
+        yield data, received
+
+#frames of a simulator training mode recording (robot_log.csv) as (telemetry data, time) pairs.
+#The log has no sample positions or flags, and frames are assumed to be `fps` apart
+def logged_frames(folder, fps=25.0):
+    with open(os.path.join(folder, 'robot_log.csv')) as log_file:
+        for idx, row in enumerate(csv.DictReader(log_file, delimiter=';')):
+            image_path = os.path.join(folder, 'IMG', os.path.basename(row['Path']))
+            if not os.path.exists(image_path):
+                image_path = os.path.join(folder, os.path.basename(row['Path']))
+            with open(image_path, 'rb') as image_file:
+                image = base64.b64encode(image_file.read()).decode('utf-8')
+            data = {'position': row['X_Position'] + ';' + row['Y_Position'],
+                    'speed': row['Speed'], 'yaw': row['Yaw'], 'pitch': row['Pitch'], 'roll': row['Roll'],
+                    'throttle': row['Throttle'], 'brake': row['Brake'], 'steering_angle': row['SteerAngle'],
+                    'near_sample': '0', 'picking_up': '0', 'sample_count': '0',
+                    'samples_x': '', 'samples_y': '', 'image': image}
+            yield data, idx / fps
+
+#the frames of a recording, whichever format it is in
+def load_frames(path):
+    if os.path.isdir(path):
+        if os.path.exists(os.path.join(path, 'robot_log.csv')):
+            return logged_frames(path)
+        path = os.path.join(path, 'run.rrec')
+    return recorded_frames(path)
+
+#Replay frames through a fresh RoverState with a world_size map. Returns the rover and the
+#per-stage times in seconds
+def replay(frames, output_images=True, world_size=200):
+    Rover = RoverState(world_size=world_size)
+    times = {stage: [] for stage in STAGES}
+    for data, received in frames:
+        start = time.perf_counter()
+        Rover = update_rover(Rover, data, received)
+        times['update_rover'].append(time.perf_counter() - start)
+        if not np.isfinite(Rover.vel):
+            continue
+
+        start = time.perf_counter()
+        Rover = perception_step(Rover)
+        times['perception_step'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        Rover = decision_step(Rover)
+        times['decision_step'].append(time.perf_counter() - start)
+        # a pickup would be sent to the simulator here
+        if Rover.send_pickup and not Rover.picking_up:
+            Rover.send_pickup = False
+
+        if output_images:
+            start = time.perf_counter()
+            create_output_images(Rover)
+            times['create_output_images'].append(time.perf_counter() - start)
+    return Rover, times
+
+#summary statistics (in milliseconds) of a list of stage times
+def summarize(stage_times):
+    if not stage_times:
+        return None
+    ms = 1000 * np.array(stage_times)
+    return {'count': len(ms), 'total': float(ms.sum()), 'mean': float(ms.mean()),
+            'p50': float(np.percentile(ms, 50)), 'p90': float(np.percentile(ms, 90)),
+            'p99': float(np.percentile(ms, 99)), 'max': float(ms.max())}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless replay of a recorded run')
+    parser.add_argument('recording', help='.rrec recording, a folder holding run.rrec, or a training mode folder')
+    parser.add_argument('--limit', type=int, default=None, help='Only replay the first N frames')
+    parser.add_argument('--skip-output-images', action='store_true', help='Do not run create_output_images')
+    parser.add_argument('--json', default=None, help='Also write the results to this JSON file')
+    parser.add_argument('--world-size', type=int, default=200, help='Size of the (square) world map in cells')
+    args = parser.parse_args()
+
+    #load the frames up front so reading the recording is not part of the timings
+    frames = []
+    for frame in load_frames(args.recording):
+        if args.limit is not None and len(frames) >= args.limit:
+            break
+        frames.append(frame)
+
+    start = time.perf_counter()
+    Rover, times = replay(frames, not args.skip_output_images, args.world_size)
+    elapsed = time.perf_counter() - start
+
+    results = {'frames': len(frames), 'seconds': elapsed, 'fps': len(frames) / elapsed if elapsed > 0 else 0,
+               'stages': {stage: summarize(times[stage]) for stage in STAGES},
+               'perc_mapped': Rover.map_stats.perc_mapped(), 'fidelity': Rover.map_stats.fidelity(),
+               'samples_located': len(Rover.map_stats.located()), 'final_mode': Rover.mode}
+
+    print('{} frames in {:.2f} s: {:.1f} frames/sec'.format(results['frames'], elapsed, results['fps']))
+    print('{:22s} {:>7s} {:>9s} {:>9s} {:>9s} {:>9s}'.format('stage (ms)', 'count', 'mean', 'p50', 'p90', 'p99'))
+    for stage in STAGES:
+        summary = results['stages'][stage]
+        if summary is not None:
+            print('{:22s} {:7d} {:9.3f} {:9.3f} {:9.3f} {:9.3f}'.format(
+                stage, summary['count'], summary['mean'], summary['p50'], summary['p90'], summary['p99']))
+    print('mapped {}%, fidelity {}%, samples located {}, final mode {}'.format(
+        results['perc_mapped'], results['fidelity'], results['samples_located'], results['final_mode']))
+
+    if args.json is not None:
+        with open(args.json, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
@@ -0,0 +1,54 @@
+import numpy as np
+import cv2
+
+#A rock sample seen in a camera frame: one connected blob of rock pixels
+class Rock():
+    def __init__(self, distance, angle, x_world, y_world, area, pixels):
+        self.distance = distance #mean rover centric distance of the blob's top down pixels
+        self.angle = angle #mean rover centric angle (radians) of the blob's top down pixels
+        self.x_world = x_world #world map cell of the blob's nearest top down pixel (the rock's base)
+        self.y_world = y_world
+        self.area = area #number of camera (region of interest) pixels in the blob
+        self.pixels = pixels #number of the blob's top down pixels inside the rock window
+        self.entry = None #the rock_registry.RockEntry the detection was merged into
+
+    def __repr__(self):
+        return 'Rock(distance={:.1f}, angle={:.1f}deg, cell=({}, {}), area={}, pixels={})'.format(
+            self.distance, self.angle * 180 / np.pi, self.x_world, self.y_world, self.area, self.pixels)
+
+#Group the rock pixels of a frame into rocks.
+#rock_mask is the boolean rock mask of the region of interest (FrameWorkspace.rocks after
+#classify_pixels), rock_pixels the indices into the workspace window tables of the rock pixels
+#inside the rock window, and transform the frame's WorldTransform. The mask is split into
+#8-connected blobs and the window pixels are grouped by the blob they are sampled from, so
+#everything after the labelling is done once per rock instead of once per rock pixel. The mask is
+#only labelled when a rock pixel is in the window, and then only within the bounding rectangle of
+#its rock pixels. Returns a list of Rock, largest first
+def detect_rocks(rock_mask, rock_pixels, workspace, transform):
+    if len(rock_pixels) == 0:
+        return []
+    rock_mask = rock_mask.view(np.uint8)
+    left, top, width, height = cv2.boundingRect(rock_mask)
+    _, blobs, stats, _ = cv2.connectedComponentsWithStats(rock_mask[top:top+height, left:left+width], connectivity=8)
+    rows, cols = np.divmod(workspace.window_src_index[rock_pixels], rock_mask.shape[1])
+    blob = blobs[rows - top, cols - left]
+    #number the blobs that reach the window 0..n_rocks-1
+    labels, blob = np.unique(blob, return_inverse=True)
+
+    pixels = np.bincount(blob)
+    dist = workspace.window_dist[rock_pixels]
+    distance = np.bincount(blob, dist) / pixels
+    angle = np.bincount(blob, workspace.window_angles[rock_pixels]) / pixels
+    #the rock stands on the ground at its nearest pixel; the rest of the blob is the rock's side
+    #projected onto the ground behind it
+    order = np.lexsort((dist, blob))
+    base = order[np.r_[True, blob[order][1:] != blob[order][:-1]]]
+    world_xy = transform.apply(workspace.window_rover_xy[rock_pixels[base]])
+    area = stats[labels, cv2.CC_STAT_AREA]
+
+    return [Rock(distance[i], angle[i], int(world_xy[i, 0]), int(world_xy[i, 1]), int(area[i]), int(pixels[i]))
+            for i in np.argsort(-pixels, kind='stable')]
+
+#the (x world, y world) cells of a list of rocks, as OccupancyGrid.update takes them
+def rock_cells(rocks):
+    return (np.int_([rock.x_world for rock in rocks]), np.int_([rock.y_world for rock in rocks]))
@@ -0,0 +1,95 @@
+#A rock known to the registry: the detections of one rock sample across frames, merged
+class RockEntry():
+    def __init__(self, x, y, pixels, time):
+        self.x = x #world map position, the mean of the detections weighted by their pixels
+        self.y = y
+        self.pixels = pixels #total top down pixels of the detections merged into this entry
+        self.detections = 1 #number of detections merged into this entry
+        self.first_seen = time #total_time of the first and of the latest detection
+        self.last_seen = time
+        self.collected = False #set once the rover picked the rock up
+
+    def __repr__(self):
+        return 'RockEntry(x={:.1f}, y={:.1f}, detections={}, first_seen={}, collected={})'.format(
+            self.x, self.y, self.detections, self.first_seen, self.collected)
+
+#Registry of the rocks seen so far. The rocks detected each frame (rock_detection.Rock) are
+#clustered into world space entries incrementally: a detection within merge_radius map cells of an
+#entry is merged into it, anything else starts a new entry. The entries are bucketed on a grid of
+#merge_radius sized cells, so finding the entry of a detection only looks at the 3x3 buckets around
+#it, and the counts the output shows are kept up to date as entries change, so every query is O(1)
+#regardless of how many rocks or frames have been seen.
+#A single detection can be noise; an entry's confidence grows with its detections and it counts
+#as confirmed after confirm_detections of them.
+class RockRegistry():
+    def __init__(self, merge_radius=3, confirm_detections=3):
+        self.merge_radius = merge_radius
+        self.confirm_detections = confirm_detections
+        self.entries = []
+        self.buckets = {} #(x, y) bucket -> entries in it
+        self.n_confirmed = 0 #number of confirmed entries
+        self.n_collected = 0 #number of collected entries
+
+    def bucket_of(self, x, y):
+        return (int(x // self.merge_radius), int(y // self.merge_radius))
+
+    #the confidence (0 to 1) that an entry is a real rock
+    def confidence(self, entry):
+        return min(1.0, entry.detections / self.confirm_detections)
+
+    def confirmed(self, entry):
+        return entry.detections >= self.confirm_detections
+
+    #the entry nearest to world position (x, y) within merge_radius, or None
+    def nearest(self, x, y):
+        bucket_x, bucket_y = self.bucket_of(x, y)
+        nearest, nearest_sqr = None, self.merge_radius**2
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for entry in self.buckets.get((bucket_x + dx, bucket_y + dy), ()):
+                    dist_sqr = (entry.x - x)**2 + (entry.y - y)**2
+                    if dist_sqr <= nearest_sqr:
+                        nearest, nearest_sqr = entry, dist_sqr
+        return nearest
+
+    #Merge the rocks detected in a frame at time `time` into the registry. Each rock's entry
+    #attribute is set to the entry it was merged into. Returns the entries created this frame
+    def add(self, rocks, time):
+        created = []
+        for rock in rocks:
+            entry = self.nearest(rock.x_world, rock.y_world)
+            if entry is None:
+                entry = RockEntry(float(rock.x_world), float(rock.y_world), rock.pixels, time)
+                self.entries.append(entry)
+                self.buckets.setdefault(self.bucket_of(entry.x, entry.y), []).append(entry)
+                if self.confirmed(entry):
+                    self.n_confirmed += 1
+                created.append(entry)
+            else:
+                self.merge(entry, rock, time)
+            rock.entry = entry
+        return created
+
+    #merge a detection into an entry, moving the entry to its new bucket if it changed
+    def merge(self, entry, rock, time):
+        bucket = self.bucket_of(entry.x, entry.y)
+        pixels = entry.pixels + rock.pixels
+        entry.x += (rock.x_world - entry.x) * rock.pixels / pixels
+        entry.y += (rock.y_world - entry.y) * rock.pixels / pixels
+        entry.pixels = pixels
+        entry.detections += 1
+        entry.last_seen = time
+        if entry.detections == self.confirm_detections:
+            self.n_confirmed += 1
+        new_bucket = self.bucket_of(entry.x, entry.y)
+        if new_bucket != bucket:
+            self.buckets[bucket].remove(entry)
+            if not self.buckets[bucket]:
+                del self.buckets[bucket]
+            self.buckets.setdefault(new_bucket, []).append(entry)
+
+    #flag an entry as collected, so it is no longer approached
+    def mark_collected(self, entry):
+        if not entry.collected:
+            entry.collected = True
+            self.n_collected += 1
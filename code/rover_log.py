@@ -0,0 +1,135 @@
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+#Structured, rate limited logging for the frame loop.
+#Everything is logged through the 'rover' logger. Records are only filtered and queued in the
+#calling thread; formatting and I/O happen on a background listener thread, so the frame loop
+#never waits on the terminal or the disk. The level, sink and rate limit can be set with the
+#ROVER_LOG_LEVEL, ROVER_LOG_SINK and ROVER_LOG_RATE environment variables (or the matching
+#drive_rover.py options) without code edits.
+#
+#  ROVER_LOG_LEVEL: silent, error, warning, info (default) or debug
+#  ROVER_LOG_SINK:  stderr (default), ring (in-memory ring buffer) or file:<path>
+#  ROVER_LOG_RATE:  minimum seconds between two records of the same message (default 1, 0 disables)
+
+log = logging.getLogger('rover')
+log.propagate = False
+
+#level name used to turn all logging off
+SILENT = 'silent'
+LEVELS = {SILENT: logging.CRITICAL + 1,
+          'error': logging.ERROR,
+          'warning': logging.WARNING,
+          'info': logging.INFO,
+          'debug': logging.DEBUG}
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+#Drops records of a message that was already let through less than `interval` seconds ago.
+#Messages are told apart by their unformatted template, so a per-frame status line is limited
+#as a whole whatever its arguments are. A record can override the interval with
+#extra={'rate_limit': seconds}.
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval=1.0):
+        super().__init__()
+        self.interval = interval
+        self.last_emitted = {}
+
+    def filter(self, record):
+        interval = getattr(record, 'rate_limit', self.interval)
+        if interval <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        if now - self.last_emitted.get(key, -interval) < interval:
+            return False
+        self.last_emitted[key] = now
+        return True
+
+#QueueHandler that never blocks the caller: if the background sink falls behind and the queue
+#is full, records are dropped and counted instead. Records are queued unformatted, the
+#listener thread formats them.
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+#Keeps the last `capacity` formatted records in memory
+class RingBufferHandler(logging.Handler):
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self.records = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+
+_listener = None
+_ring_buffer = None
+
+#the sink handler for a ROVER_LOG_SINK value
+def _make_sink(sink):
+    global _ring_buffer
+    if sink == 'ring':
+        _ring_buffer = RingBufferHandler()
+        return _ring_buffer
+    if sink.startswith('file:'):
+        return logging.FileHandler(sink[len('file:'):])
+    if sink == 'stderr':
+        return logging.StreamHandler(sys.stderr)
+    raise ValueError("Unknown log sink '{}', expected stderr, ring or file:<path>".format(sink))
+
+#Configure the rover logger. Arguments left as None fall back to the environment variables,
+#then to the defaults. Can be called again to reconfigure.
+def configure_logging(level=None, sink=None, rate_limit=None, queue_size=10000):
+    global _listener, _ring_buffer
+    level = (level or os.environ.get('ROVER_LOG_LEVEL', 'info')).lower()
+    sink = sink or os.environ.get('ROVER_LOG_SINK', 'stderr')
+    if rate_limit is None:
+        rate_limit = float(os.environ.get('ROVER_LOG_RATE', 1.0))
+    if level not in LEVELS:
+        raise ValueError("Unknown log level '{}', expected one of {}".format(level, ', '.join(LEVELS)))
+
+    shutdown_logging()
+    _ring_buffer = None
+    log.setLevel(LEVELS[level])
+    #when silent, no handler is installed and every log call returns at the level check
+    if level == SILENT:
+        return
+
+    sink_handler = _make_sink(sink)
+    sink_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(RateLimitFilter(rate_limit))
+    log.addHandler(queue_handler)
+    _listener = logging.handlers.QueueListener(queue_handler.queue, sink_handler)
+    _listener.start()
+
+#flush the queued records and stop the background listener
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+        handler.close()
+
+#the records held by the ring buffer sink, oldest first (empty unless the sink is 'ring')
+def ring_buffer():
+    if _ring_buffer is None:
+        return []
+    return list(_ring_buffer.records)
@@ -0,0 +1,91 @@
+import os
+import numpy as np
+import matplotlib.image as mpimg
+
+from calibration import CameraCalibration
+from mapping import TiledOccupancyGrid
+from map_statistics import MapStatistics
+from polar_histogram import PolarHistogram
+from rock_registry import RockRegistry
+from workspace import FrameWorkspace
+
+# Read in ground truth map and create 3-channel green version for overplotting
+# NOTE: images are read in by default with the origin (0, 0) in the upper left
+# and y-axis increasing downward.
+ground_truth = mpimg.imread(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                         '..', 'calibration_images', 'map_bw.png'))
+# This next line creates arrays of zeros in the red and blue channels
+# and puts the map into the green channel.  This is why the underlying 
+# map output looks green in the display image
+ground_truth_3d = np.dstack((ground_truth*0, ground_truth*255, ground_truth*0)).astype(np.float)
+
+# Define RoverState() class to retain rover state parameters
+#world_size is the size of the (square) world map in cells (meters); the occupancy grid and the
+#map statistics are built for it, so it can only be set here
+class RoverState():
+    def __init__(self, world_size=200):
+        self.start_time = None # To record the start time of navigation
+        self.total_time = None # To record total duration of naviagation
+        self.img = np.zeros((160, 320, 3), dtype=np.uint8) # Current camera image (a reused frame buffer)
+        self.pos = None # Current position (x, y)
+        self.yaw = None # Current yaw angle
+        self.pitch = None # Current pitch angle
+        self.roll = None # Current roll angle
+        self.vel = None # Current velocity
+        self.steer = 0 # Current steering angle
+        self.throttle = 0 # Current throttle value
+        self.brake = 0 # Current brake value
+        self.ground_truth = ground_truth_3d # Ground truth worldmap
+        self.mode = 'Find Wall' # Current rover mode
+        self.throttle_set = .5 # Throttle setting when accelerating
+        self.brake_set = 5 # Brake setting when braking
+        self.max_vel = 1.5 # Maximum velocity (meters/second)
+        # Image output from perception step
+        # Update this image to display your intermediate analysis steps
+        # on screen in autonomous mode
+        self.vision_image = np.zeros((160, 320, 3), dtype=np.float) 
+        # Worldmap
+        # Update this grid with the positions of navigable terrain
+        # obstacles and rock samples; it renders to an RGB worldmap on demand
+        self.world_size = world_size # Size of the (square) world in map cells (meters)
+        self.occupancy = TiledOccupancyGrid(self.world_size) # Tiles are allocated as the rover explores
+        self.map_stats = MapStatistics(ground_truth_3d, self.world_size) # Mapped %, fidelity and located samples
+        self.calibration = CameraCalibration() # Precomputed camera to rover lookup tables
+        self.workspace = FrameWorkspace(self.calibration.roi_shape, self.calibration) # Reused per-frame perception buffers
+        self.polar = PolarHistogram(self.workspace.window_angles) # Navigable terrain and obstacles in view per angle sector
+        self.samples_pos = None # To store the actual sample positions
+        self.samples_to_find = 0 # To store the initial count of samples
+        self.samples_located = 0 # To store number of samples located on map
+        self.samples_collected = 0 # To count the number of samples collected
+        self.near_sample = 0 # Will be set to telemetry value data["near_sample"]
+        self.picking_up = 0 # Will be set to telemetry value data["picking_up"]
+        self.send_pickup = False # Set to True to trigger rock pickup
+        self.wall_on_left = None # Boolean if wall on left of rover
+        self.wall_on_left_threshold_pix = 600 #the threshold for determining if there is a wall on the
+            #left of the rover
+        self.wall_left_amount = None #for outputting/debugging
+        self.time_without_seeing_wall = 0 #record how long we havent seen a wall on the left
+        self.time_lost_wall_threshold =5 #if we havent seen a wall for this long, we lost the wall
+        self.time_last = 0.0 #the last time recorded
+        self.time_mean_distance_less_than_thresh = 0 #record how long an obstacle is in our path
+        self.max_time_mean_distance_less_than_thresh = 1.5  #if obstacle in path for this long, not clear path.
+        self.aggresive_steering_amplitude = 3.5 #How aggresive the rover is when steering towards an optimal path
+        self.clear_path_pixels = 400 #The navigable pixels in view needed for a clear path for the rover
+
+        self.rover_stuck_check_interval = 10 #check if the rover is stuck this often (seconds)
+        self.rover_stuck_check_time_last_checked = 0
+        self.rover_stuck_check_distance_threshold = 0.5
+        #store these positions to compare with at each stuck-check interval
+        self.rover_stuck_check_last_x = 0 
+        self.rover_stuck_check_last_y = 0
+        self.rover_stuck_yaw = None
+
+        #rock mode
+        self.pos_when_finding_rock = None
+        self.yaw_when_finding_rock = None
+        self.rocks = [] #the rocks (rock_detection.Rock) seen in the current frame, largest first
+        self.rock_registry = RockRegistry() #every rock seen so far, clustered in world space
+        self.target_rock = None #the registry entry of the rock being approached in ROCK mode
+        self.rock_thresh = 10 #a rock needs more top down pixels than this to be driven to
+        self.time_rock_max = 20
+        self.time_rock = 0
@@ -0,0 +1,182 @@
+#Local stand-in for the Unity simulator and load generator for the drive_rover.py server.
+#Speaks the simulator's socketio protocol: it connects, ignores the connect time 'get_samples'
+#request, sends 'telemetry' events and waits for the server's 'data' (control) or 'pickup'
+#replies. It reports the round-trip control latency and the achieved frame rate, so server
+#changes can be load tested end to end without the simulator or a GPU.
+#
+#Two load modes:
+#  closed loop (default): like the simulator, the next frame is sent as soon as the reply to the
+#      previous one arrives, which measures the maximum sustainable FPS
+#  open loop (--rate FPS): frames are sent at a fixed rate whatever the server does
+#
+#Frames come from a drive_rover.py recording (--recording) or are built from the calibration
+#images, with the rover pose driven by the commands the server sends back.
+#
+#usage (from the code directory, with drive_rover.py running):
+#  python sim_standin.py [--url http://localhost:4567] [--duration 10] [--rate FPS] [--recording run.rrec]
+import argparse
+import base64
+import collections
+import glob
+import itertools
+import os
+import threading
+import time
+
+import numpy as np
+import socketio
+
+from recorder import read_recording
+
+#Telemetry built from the calibration images. The pose follows a simple kinematic model driven
+#by the throttle, brake and steering commands the server replies with.
+class SyntheticTelemetry():
+    def __init__(self, samples_x='101;60;150', samples_y='86;100;120'):
+        image_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'calibration_images')
+        images = []
+        for image_path in sorted(glob.glob(os.path.join(image_dir, '*.jpg'))):
+            with open(image_path, 'rb') as image_file:
+                images.append(base64.b64encode(image_file.read()).decode('utf-8'))
+        self.images = itertools.cycle(images)
+        self.samples_x = samples_x
+        self.samples_y = samples_y
+        self.x, self.y, self.yaw, self.speed = 100.0, 85.0, 0.0, 0.0
+        self.throttle, self.brake, self.steer = 0.0, 0.0, 0.0
+        self.last = None
+
+    #apply the latest control command from the server
+    def control(self, throttle, brake, steer):
+        self.throttle, self.brake, self.steer = throttle, brake, steer
+
+    def next_frame(self):
+        now = time.time()
+        dt = 0 if self.last is None else min(now - self.last, 0.2)
+        self.last = now
+        self.speed = float(np.clip(self.speed + (2*self.throttle - self.brake - 0.2*self.speed)*dt, 0, 2))
+        self.yaw = (self.yaw + 2*self.steer*dt) % 360
+        self.x += self.speed*np.cos(np.radians(self.yaw))*dt
+        self.y += self.speed*np.sin(np.radians(self.yaw))*dt
+        return {'samples_x': self.samples_x, 'samples_y': self.samples_y, 'sample_count': '3',
+                'speed': str(self.speed), 'position': '{};{}'.format(self.x, self.y),
+                'yaw': str(self.yaw), 'pitch': '0', 'roll': '0', 'throttle': str(self.throttle),
+                'brake': str(self.brake), 'steering_angle': str(self.steer),
+                'near_sample': '0', 'picking_up': '0', 'image': next(self.images)}
+
+#Telemetry replayed (in a loop) from a drive_rover.py recording
+class RecordedTelemetry():
+    def __init__(self, path):
+        self.frames = []
+        for telemetry, jpeg in read_recording(path):
+            data = dict(telemetry)
+            data.pop('time')
+            data['image'] = base64.b64encode(jpeg).decode('utf-8')
+            self.frames.append(data)
+        if not self.frames:
+            raise ValueError('{} holds no frames'.format(path))
+        self.cycle = itertools.cycle(self.frames)
+
+    def control(self, throttle, brake, steer):
+        pass
+
+    def next_frame(self):
+        return next(self.cycle)
+
+#Simulator stand-in: sends telemetry to the server and times the replies. Replies are matched to
+#frames in order, as the server answers every telemetry frame with exactly one reply.
+class SimulatorStandIn():
+    def __init__(self, url, telemetry):
+        self.url = url
+        self.telemetry = telemetry
+        self.client = socketio.Client()
+        self.client.on('data', self.on_data)
+        self.client.on('pickup', self.on_pickup)
+        self.client.on('get_samples', lambda data: None)
+        self.client.on('manual', lambda data: None)
+        self.lock = threading.Lock()
+        self.pending = collections.deque() #send times of the frames waiting for a reply
+        self.replied = threading.Event()
+        self.latencies = []
+        self.frames_sent = 0
+        self.pickups = 0
+
+    def on_data(self, data):
+        try:
+            self.telemetry.control(float(data['throttle']), float(data['brake']), float(data['steering_angle']))
+        except (KeyError, ValueError):
+            pass
+        self.on_reply()
+
+    def on_pickup(self, data):
+        self.pickups += 1
+        self.on_reply()
+
+    def on_reply(self):
+        received = time.perf_counter()
+        with self.lock:
+            #the connect time reply is not an answer to a frame
+            if not self.pending:
+                return
+            self.latencies.append(received - self.pending.popleft())
+        self.replied.set()
+
+    def send(self):
+        data = self.telemetry.next_frame()
+        with self.lock:
+            self.pending.append(time.perf_counter())
+        self.frames_sent += 1
+        self.client.emit('telemetry', data)
+
+    #run for `duration` seconds; closed loop if rate is None, else open loop at `rate` frames/sec
+    def run(self, duration, rate=None, reply_timeout=5.0):
+        self.client.connect(self.url)
+        try:
+            start = time.perf_counter()
+            next_send = start
+            while time.perf_counter() - start < duration:
+                if rate is None:
+                    self.replied.clear()
+                    self.send()
+                    if not self.replied.wait(reply_timeout):
+                        print('No reply within {} s, stopping'.format(reply_timeout))
+                        break
+                else:
+                    self.send()
+                    next_send += 1.0 / rate
+                    time.sleep(max(0, next_send - time.perf_counter()))
+            elapsed = time.perf_counter() - start
+            #give the last open loop frames a chance to be answered
+            deadline = time.perf_counter() + reply_timeout
+            while self.pending and time.perf_counter() < deadline:
+                time.sleep(0.01)
+        finally:
+            self.client.disconnect()
+        return elapsed
+
+    def report(self, elapsed):
+        ms = 1000 * np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {'frames_sent': self.frames_sent, 'replies': len(self.latencies), 'pickups': self.pickups,
+                'seconds': elapsed, 'fps': len(self.latencies) / elapsed if elapsed > 0 else 0,
+                'latency_ms': {'mean': float(ms.mean()), 'p50': float(np.percentile(ms, 50)),
+                               'p90': float(np.percentile(ms, 90)), 'p99': float(np.percentile(ms, 99)),
+                               'max': float(ms.max())}}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulator stand-in and load generator')
+    parser.add_argument('--url', default='http://localhost:4567', help='drive_rover.py server URL')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run for')
+    parser.add_argument('--rate', type=float, default=None, help='Open loop frame rate (default: closed loop)')
+    parser.add_argument('--recording', default=None, help='Replay frames from this .rrec recording')
+    args = parser.parse_args()
+
+    if args.recording is not None:
+        telemetry = RecordedTelemetry(args.recording)
+    else:
+        telemetry = SyntheticTelemetry()
+    standin = SimulatorStandIn(args.url, telemetry)
+    results = standin.report(standin.run(args.duration, args.rate))
+
+    latency = results['latency_ms']
+    print('{} frames sent, {} replies ({} pickups) in {:.2f} s: {:.1f} frames/sec'.format(
+        results['frames_sent'], results['replies'], results['pickups'], results['seconds'], results['fps']))
+    print('round trip latency (ms): mean {:.2f}  p50 {:.2f}  p90 {:.2f}  p99 {:.2f}  max {:.2f}'.format(
+        latency['mean'], latency['p50'], latency['p90'], latency['p99'], latency['max']))
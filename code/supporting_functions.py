@@ -5,6 +5,9 @@ from io import BytesIO, StringIO
 import base64
 import time
 
+from rover_log import log
+from probes import probe
+
 # Define a function to convert telemetry strings to float independent of decimal convention
 def convert_to_float(string_to_convert):
       if ',' in string_to_convert:
@@ -13,152 +16,154 @@ def convert_to_float(string_to_convert):
             float_value = np.float(string_to_convert)
       return float_value
 
-def update_rover(Rover, data):
+# Telemetry fields holding a single float value, in the order they are parsed
+FLOAT_FIELDS = ("speed", "yaw", "pitch", "roll", "throttle", "steering_angle")
+
+# Parse the position and all single float telemetry fields in one pass, independent of decimal convention.
+# Returns the position as a list followed by the FLOAT_FIELDS values
+def parse_telemetry_floats(data):
+      position = data["position"]
+      n_pos = position.count(';') + 1
+      fields = ';'.join([position] + [data[key] for key in FLOAT_FIELDS]).replace(',', '.')
+      values = [float(value) for value in fields.split(';')]
+      return [values[:n_pos]] + values[n_pos:]
+
+# Decode a JPEG straight into a reused RGB frame buffer, reallocating it only if the image size changes
+def decode_frame(jpeg, frame_buffer):
+      bgr = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+      if frame_buffer is None or frame_buffer.shape != bgr.shape:
+            frame_buffer = np.empty_like(bgr)
+      cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=frame_buffer)
+      return frame_buffer
+
+# Update the Rover with a telemetry frame. `now` is the time the frame was received,
+# the current time unless given (e.g. when replaying a recorded run)
+def update_rover(Rover, data, now=None):
+      if now is None:
+            now = time.time()
       # Initialize start time and sample positions
       if Rover.start_time == None:
-            Rover.start_time = time.time()
+            Rover.start_time = now
             Rover.total_time = 0
-            samples_xpos = np.int_([convert_to_float(pos.strip()) for pos in data["samples_x"].split(';')])
-            samples_ypos = np.int_([convert_to_float(pos.strip()) for pos in data["samples_y"].split(';')])
+            samples_xpos = np.int_([convert_to_float(pos.strip()) for pos in data["samples_x"].split(';') if pos.strip()])
+            samples_ypos = np.int_([convert_to_float(pos.strip()) for pos in data["samples_y"].split(';') if pos.strip()])
             Rover.samples_pos = (samples_xpos, samples_ypos)
             Rover.samples_to_find = np.int(data["sample_count"])
+            # Index the sample positions once for the rock located checks
+            Rover.map_stats.set_samples(Rover.samples_pos)
       # Or just update elapsed time
       else:
-            tot_time = time.time() - Rover.start_time
+            tot_time = now - Rover.start_time
             if np.isfinite(tot_time):
                   Rover.total_time = tot_time
-      # Print out the fields in the telemetry data dictionary
-      print(data.keys())
-      # The current speed of the rover in m/s
-      Rover.vel = convert_to_float(data["speed"])
-      # The current position of the rover
-      Rover.pos = [convert_to_float(pos.strip()) for pos in data["position"].split(';')]
-      # The current yaw angle of the rover
-      Rover.yaw = convert_to_float(data["yaw"])
-      # The current yaw angle of the rover
-      Rover.pitch = convert_to_float(data["pitch"])
-      # The current yaw angle of the rover
-      Rover.roll = convert_to_float(data["roll"])
-      # The current throttle setting
-      Rover.throttle = convert_to_float(data["throttle"])
-      # The current steering angle
-      Rover.steer = convert_to_float(data["steering_angle"])
+      # Log the fields in the telemetry data dictionary
+      log.debug('Telemetry fields: %s', data.keys())
+      # The current position, speed (m/s), yaw, pitch and roll angles, throttle and steering angle
+      Rover.pos, Rover.vel, Rover.yaw, Rover.pitch, Rover.roll, \
+      Rover.throttle, Rover.steer = parse_telemetry_floats(data)
       # Near sample flag
-      Rover.near_sample = np.int(data["near_sample"])
+      Rover.near_sample = int(data["near_sample"])
       # Picking up flag
-      Rover.picking_up = np.int(data["picking_up"])
+      Rover.picking_up = int(data["picking_up"])
       # Update number of rocks collected
-      Rover.samples_collected = Rover.samples_to_find - np.int(data["sample_count"])
+      Rover.samples_collected = Rover.samples_to_find - int(data["sample_count"])
+
+      log.debug('speed = %s position = %s throttle = %s steer_angle = %s near_sample: %s '
+                'picking_up: %s sending pickup: %s total time: %s samples remaining: %s '
+                'samples collected: %s', Rover.vel, Rover.pos, Rover.throttle, Rover.steer,
+                Rover.near_sample, data["picking_up"], Rover.send_pickup, Rover.total_time,
+                data["sample_count"], Rover.samples_collected)
+      # Get the current image from the center camera of the rover,
+      # decoded into the frame buffer that is reused from frame to frame
+      with probe('decode'):
+            jpeg = base64.b64decode(data["image"])
+            Rover.img = decode_frame(jpeg, Rover.img)
+
+      return Rover
+
+# Overlay the world map on the ground truth map, with the known samples that have been located.
+# Returns the overlay (y-axis pointing down, as the map is stored) and the number of samples located
+def overlay_worldmap(occupancy, stats, samples_pos):
 
-      print('speed =',Rover.vel, 'position =', Rover.pos, 'throttle =', 
-      Rover.throttle, 'steer_angle =', Rover.steer, 'near_sample:', Rover.near_sample, 
-      'picking_up:', data["picking_up"], 'sending pickup:', Rover.send_pickup, 
-      'total time:', Rover.total_time, 'samples remaining:', data["sample_count"], 
-      'samples collected:', Rover.samples_collected)
-      # Get the current image from the center camera of the rover
-      imgString = data["image"]
-      image = Image.open(BytesIO(base64.b64decode(imgString)))
-      Rover.img = np.asarray(image)
+      # Render the occupancy grid to an RGB worldmap over the area covered by the ground truth map only
+      with probe('output.render_map'):
+            worldmap = occupancy.render((stats.gt_h, stats.gt_w))
 
-      # Return updated Rover and separate image for optional saving
-      return Rover, image
+      # Overlay the obstacle (red) and navigable terrain (blue) map with the ground truth map
+      map_add = stats.background.copy()
+      map_add[:, :, 0] = worldmap[:, :, 0]
+      map_add[:, :, 2] = worldmap[:, :, 2]
+
+      # Plot the location of the known samples a rock was detected within 3 meters of
+      rock_size = 2
+      located = stats.located()
+      for idx in located:
+            test_rock_x = samples_pos[0][idx]
+            test_rock_y = samples_pos[1][idx]
+            map_add[test_rock_y-rock_size:test_rock_y+rock_size, 
+            test_rock_x-rock_size:test_rock_x+rock_size, :] = 255
+      return map_add, len(located)
+
+# The values shown next to the world map, read from the rover state all at once so that the output
+# images can be drawn later (or on another thread) without reading the rover state again
+def output_state(Rover):
+      stats = Rover.map_stats
+      return {'time': Rover.total_time,
+              # The map statistics are kept up to date incrementally by the perception step
+              'mapped': stats.perc_mapped(),
+              'fidelity': stats.fidelity(),
+              'rocks_seen': Rover.rock_registry.n_confirmed,
+              'collected': Rover.samples_collected,
+              'mode': Rover.mode,
+              'mean_dist': Rover.polar.nav_mean_dist,
+              'wall_left': Rover.wall_on_left,
+              'wall_left_amount': Rover.wall_left_amount}
 
 # Define a function to create display output given worldmap results
 def create_output_images(Rover):
+      map_add, samples_located = overlay_worldmap(Rover.occupancy, Rover.map_stats, Rover.samples_pos)
+      return encode_output_images(map_add, samples_located, output_state(Rover), Rover.vision_image)
+
+# Draw the map statistics (an output_state) onto the world map overlay (see overlay_worldmap) and
+# encode it and the vision image as base64 JPEG strings for the simulator
+def encode_output_images(map_add, samples_located, state, vision_image):
 
-      # Create a scaled map for plotting and clean up obs/nav pixels a bit
-      if np.max(Rover.worldmap[:,:,2]) > 0:
-            nav_pix = Rover.worldmap[:,:,2] > 0
-            navigable = Rover.worldmap[:,:,2] * (255 / np.mean(Rover.worldmap[nav_pix, 2]))
-      else: 
-            navigable = Rover.worldmap[:,:,2]
-      if np.max(Rover.worldmap[:,:,0]) > 0:
-            obs_pix = Rover.worldmap[:,:,0] > 0
-            obstacle = Rover.worldmap[:,:,0] * (255 / np.mean(Rover.worldmap[obs_pix, 0]))
-      else:
-            obstacle = Rover.worldmap[:,:,0]
-
-      likely_nav = navigable >= obstacle
-      obstacle[likely_nav] = 0
-      plotmap = np.zeros_like(Rover.worldmap)
-      plotmap[:, :, 0] = obstacle
-      plotmap[:, :, 2] = navigable
-      plotmap = plotmap.clip(0, 255)
-      # Overlay obstacle and navigable terrain map with ground truth map
-      map_add = cv2.addWeighted(plotmap, 1, Rover.ground_truth, 0.5, 0)
-
-      # Check whether any rock detections are present in worldmap
-      rock_world_pos = Rover.worldmap[:,:,1].nonzero()
-      # If there are, we'll step through the known sample positions
-      # to confirm whether detections are real
-      samples_located = 0
-      if rock_world_pos[0].any():
-            
-            rock_size = 2
-            for idx in range(len(Rover.samples_pos[0])):
-                  test_rock_x = Rover.samples_pos[0][idx]
-                  test_rock_y = Rover.samples_pos[1][idx]
-                  rock_sample_dists = np.sqrt((test_rock_x - rock_world_pos[1])**2 + \
-                                        (test_rock_y - rock_world_pos[0])**2)
-                  # If rocks were detected within 3 meters of known sample positions
-                  # consider it a success and plot the location of the known
-                  # sample on the map
-                  if np.min(rock_sample_dists) < 3:
-                        samples_located += 1
-                        map_add[test_rock_y-rock_size:test_rock_y+rock_size, 
-                        test_rock_x-rock_size:test_rock_x+rock_size, :] = 255
-
-      # Calculate some statistics on the map results
-      # First get the total number of pixels in the navigable terrain map
-      tot_nav_pix = np.float(len((plotmap[:,:,2].nonzero()[0])))
-      # Next figure out how many of those correspond to ground truth pixels
-      good_nav_pix = np.float(len(((plotmap[:,:,2] > 0) & (Rover.ground_truth[:,:,1] > 0)).nonzero()[0]))
-      # Next find how many do not correspond to ground truth pixels
-      bad_nav_pix = np.float(len(((plotmap[:,:,2] > 0) & (Rover.ground_truth[:,:,1] == 0)).nonzero()[0]))
-      # Grab the total number of map pixels
-      tot_map_pix = np.float(len((Rover.ground_truth[:,:,1].nonzero()[0])))
-      # Calculate the percentage of ground truth map that has been successfully found
-      perc_mapped = round(100*good_nav_pix/tot_map_pix, 1)
-      # Calculate the number of good map pixel detections divided by total pixels 
-      # found to be navigable terrain
-      if tot_nav_pix > 0:
-            fidelity = round(100*good_nav_pix/(tot_nav_pix), 1)
-      else:
-            fidelity = 0
       # Flip the map for plotting so that the y-axis points upward in the display
-      map_add = np.flipud(map_add).astype(np.float32)
+      map_add = np.ascontiguousarray(np.flipud(map_add))
       # Add some text about map and rock sample detection results
-      cv2.putText(map_add,"Time: "+str(np.round(Rover.total_time, 1))+' s', (0, 10), 
+      cv2.putText(map_add,"Time: "+str(np.round(state['time'], 1))+' s', (0, 10), 
                   cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
-      cv2.putText(map_add,"Mapped: "+str(perc_mapped)+'%', (0, 25), 
+      cv2.putText(map_add,"Mapped: "+str(state['mapped'])+'%', (0, 25), 
                   cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
-      cv2.putText(map_add,"Fidelity: "+str(fidelity)+'%', (0, 40), 
+      cv2.putText(map_add,"Fidelity: "+str(state['fidelity'])+'%', (0, 40), 
                   cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
-      cv2.putText(map_add,"Rocks", (0, 55), 
+      cv2.putText(map_add,"Rocks  Seen: "+str(state['rocks_seen']), (0, 55), 
                   cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
       cv2.putText(map_add,"  Located: "+str(samples_located), (0, 70), 
                   cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
-      cv2.putText(map_add,"  Collected: "+str(Rover.samples_collected), (0, 85), 
+      cv2.putText(map_add,"  Collected: "+str(state['collected']), (0, 85), 
                   cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
-      cv2.putText(map_add,"Rover Mode: "+str(Rover.mode), (0, 100), 
+      cv2.putText(map_add,"Rover Mode: "+str(state['mode']), (0, 100), 
                   cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
-      cv2.putText(map_add,"Mean distances: "+str(Rover.nav_dists.mean()), (0, 115), 
+      cv2.putText(map_add,"Mean distances: "+str(state['mean_dist']), (0, 115), 
                   cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
-      cv2.putText(map_add,"Wall left: "+str(Rover.wall_on_left), (0, 130), 
+      cv2.putText(map_add,"Wall left: "+str(state['wall_left']), (0, 130), 
                   cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
-      cv2.putText(map_add,"Wall left #: "+str(Rover.wall_left_amount), (0, 145), 
+      cv2.putText(map_add,"Wall left #: "+str(state['wall_left_amount']), (0, 145), 
                   cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
       
       # Convert map and vision image to base64 strings for sending to server
-      pil_img = Image.fromarray(map_add.astype(np.uint8))
-      buff = BytesIO()
-      pil_img.save(buff, format="JPEG")
-      encoded_string1 = base64.b64encode(buff.getvalue()).decode("utf-8")
+      with probe('output.map_jpeg'):
+            pil_img = Image.fromarray(map_add)
+            buff = BytesIO()
+            pil_img.save(buff, format="JPEG")
+            encoded_string1 = base64.b64encode(buff.getvalue()).decode("utf-8")
       
-      pil_img = Image.fromarray(Rover.vision_image.astype(np.uint8))
-      buff = BytesIO()
-      pil_img.save(buff, format="JPEG")
-      encoded_string2 = base64.b64encode(buff.getvalue()).decode("utf-8")
+      with probe('output.vision_jpeg'):
+            pil_img = Image.fromarray(vision_image.astype(np.uint8))
+            buff = BytesIO()
+            pil_img.save(buff, format="JPEG")
+            encoded_string2 = base64.b64encode(buff.getvalue()).decode("utf-8")
 
       return encoded_string1, encoded_string2
 
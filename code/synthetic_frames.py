@@ -0,0 +1,149 @@
+#Synthetic rover camera frames rendered from the ground truth map.
+#Every camera pixel below the horizon is projected onto the ground through the inverse of the
+#perception calibration (calibration.CameraCalibration). Walking out from the rover along the
+#pixel's bearing, the pixel shows navigable floor if the ground truth map is navigable all the
+#way out to the pixel's ground point, and the wall it ran into otherwise; pixels above the
+#horizon show the walls or the sky. Rocks are drawn as yellow discs on the ground. Each frame
+#comes with a label image of NAVIGABLE/OBSTACLE/ROCK flags (see perception.classify_pixels),
+#which gives unlimited labeled frames for throughput benchmarks and accuracy comparisons of
+#perception variants without recorded footage.
+#
+#usage (from the code directory): python synthetic_frames.py <output.rrec> [--frames N] [--seed S]
+#writes a recording of frames at random poses that replay.py and sim_standin.py can use
+import argparse
+import base64
+
+import cv2
+import numpy as np
+
+from calibration import CameraCalibration
+from perception import NAVIGABLE, OBSTACLE, ROCK
+from recorder import FrameRecorder
+from rover_state import ground_truth
+
+#frame colors (RGB), picked to sit clearly on the right side of the perception thresholds
+FLOOR_COLOR = (190, 170, 150)
+WALL_COLOR = (100, 80, 60)
+SKY_COLOR = (130, 140, 160)
+ROCK_COLOR = (170, 140, 20)
+
+class FrameSynthesizer():
+    def __init__(self, ground_truth=ground_truth, rocks=(), calibration=None, scale=10,
+                 max_range=30, rock_radius=0.4, noise=4, seed=None):
+        self.navigable_map = ground_truth > 0
+        self.rocks = np.float64(rocks).reshape(-1, 2) #rock (x, y) world positions in meters
+        self.rock_radius = rock_radius
+        self.noise = noise
+        self.random = np.random.RandomState(seed)
+        calibration = calibration or CameraCalibration()
+        self.img_h, self.img_w = calibration.img_shape
+
+        #project every camera pixel onto the ground plane, in rover coordinates (meters)
+        ypos, xpos = np.mgrid[0:self.img_h, 0:self.img_w]
+        camera = np.stack((xpos.ravel(), ypos.ravel(), np.ones(xpos.size)))
+        top_down = calibration.M.dot(camera)
+        #pixels below the horizon have the same sign of w as the bottom row of the image
+        bottom_sign = np.sign(calibration.M.dot([self.img_w/2, self.img_h - 1, 1])[2])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_top = top_down[0] / top_down[2]
+            y_top = top_down[1] / top_down[2]
+        self.xpix = -(y_top - self.img_h) / scale
+        self.ypix = -(x_top - self.img_w/2) / scale
+        self.ground = (np.sign(top_down[2]) == bottom_sign) & (self.xpix > 0)
+        self.ground &= np.hypot(self.xpix, self.ypix) < max_range
+        self.dist = np.where(self.ground, np.hypot(self.xpix, self.ypix), np.inf)
+
+        #bearing of every pixel (the column's bearing for the pixels above the horizon),
+        #quantized into bins that are ray marched for the first wall each frame
+        bearing = np.arctan2(self.ypix, self.xpix)
+        column_bearing = np.zeros(self.img_w)
+        bottom_row = slice((self.img_h - 1) * self.img_w, self.img_h * self.img_w)
+        column_bearing[:] = bearing[bottom_row]
+        bearing = np.where(self.ground, bearing, np.tile(column_bearing, self.img_h))
+        self.n_bins = 256
+        self.bin_edges = np.linspace(bearing.min(), bearing.max(), self.n_bins + 1)
+        self.bins = np.clip(np.digitize(bearing, self.bin_edges) - 1, 0, self.n_bins - 1)
+        self.bin_bearings = (self.bin_edges[:-1] + self.bin_edges[1:]) / 2
+        self.steps = np.arange(0.25, max_range, 0.25)
+
+    #distance to the first non navigable ground truth cell along each bearing bin
+    def wall_distances(self, x, y, yaw_rad):
+        angles = self.bin_bearings[:, None] + yaw_rad
+        world_x = np.int_(x + self.steps[None, :] * np.cos(angles))
+        world_y = np.int_(y + self.steps[None, :] * np.sin(angles))
+        inside = (world_x >= 0) & (world_x < self.navigable_map.shape[1]) & \
+                 (world_y >= 0) & (world_y < self.navigable_map.shape[0])
+        blocked = ~inside
+        blocked[inside] = ~self.navigable_map[world_y[inside], world_x[inside]]
+        first = np.where(blocked.any(axis=1), blocked.argmax(axis=1), len(self.steps) - 1)
+        return self.steps[first]
+
+    #Render the camera frame seen from world position (x, y) with the given yaw (degrees).
+    #Returns the RGB frame and its label image
+    def render(self, x, y, yaw):
+        yaw_rad = yaw * np.pi / 180
+        wall_dist = self.wall_distances(x, y, yaw_rad)[self.bins]
+
+        floor = self.ground & (self.dist < wall_dist)
+        #pixels above the horizon show a wall if there is one in range, the sky otherwise
+        sky = ~self.ground & (wall_dist >= self.steps[-1])
+
+        #rocks lying on the visible floor
+        rock = np.zeros(floor.shape, dtype=bool)
+        if len(self.rocks):
+            world_x = x + self.xpix[floor] * np.cos(yaw_rad) - self.ypix[floor] * np.sin(yaw_rad)
+            world_y = y + self.xpix[floor] * np.sin(yaw_rad) + self.ypix[floor] * np.cos(yaw_rad)
+            rock_dists = np.hypot(world_x[:, None] - self.rocks[:, 0], world_y[:, None] - self.rocks[:, 1])
+            rock[floor] = (rock_dists < self.rock_radius).any(axis=1)
+        floor &= ~rock
+
+        frame = np.empty((floor.size, 3), dtype=np.float64)
+        frame[:] = WALL_COLOR
+        frame[sky] = SKY_COLOR
+        frame[floor] = FLOOR_COLOR
+        frame[rock] = ROCK_COLOR
+        if self.noise:
+            frame += self.random.normal(0, self.noise, frame.shape)
+        frame = np.clip(frame, 0, 255).astype(np.uint8).reshape(self.img_h, self.img_w, 3)
+
+        labels = np.full(floor.size, OBSTACLE, dtype=np.uint8)
+        labels[floor] = NAVIGABLE
+        labels[rock] = ROCK
+        return frame, labels.reshape(self.img_h, self.img_w)
+
+    #a random pose on navigable ground
+    def random_pose(self):
+        ys, xs = self.navigable_map.nonzero()
+        idx = self.random.randint(len(xs))
+        return xs[idx] + self.random.rand(), ys[idx] + self.random.rand(), 360 * self.random.rand()
+
+    #random rock positions on navigable ground
+    def random_rocks(self, count):
+        return [self.random_pose()[:2] for _ in range(count)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a recording of synthetic camera frames')
+    parser.add_argument('output', help='Recording (.rrec) to write')
+    parser.add_argument('--frames', type=int, default=500, help='Number of frames')
+    parser.add_argument('--rocks', type=int, default=6, help='Number of rocks placed on the map')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    synthesizer = FrameSynthesizer(seed=args.seed)
+    rocks = synthesizer.random_rocks(args.rocks)
+    synthesizer.rocks = np.float64(rocks).reshape(-1, 2)
+    samples_x = ';'.join(str(int(rock[0])) for rock in rocks)
+    samples_y = ';'.join(str(int(rock[1])) for rock in rocks)
+
+    recorder = FrameRecorder(args.output, capacity=args.frames)
+    for idx in range(args.frames):
+        x, y, yaw = synthesizer.random_pose()
+        frame, _ = synthesizer.render(x, y, yaw)
+        jpeg = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))[1].tobytes()
+        recorder.record({'samples_x': samples_x, 'samples_y': samples_y, 'sample_count': str(len(rocks)),
+                         'speed': '1.0', 'position': '{};{}'.format(x, y), 'yaw': str(yaw),
+                         'pitch': '0', 'roll': '0', 'throttle': '0', 'brake': '0', 'steering_angle': '0',
+                         'near_sample': '0', 'picking_up': '0',
+                         'image': base64.b64encode(jpeg).decode('utf-8')})
+    recorder.close()
+    print('Wrote {} frames to {}'.format(recorder.frames_written, args.output))
@@ -0,0 +1,54 @@
+import numpy as np
+
+#number of pixel sets get_world_coordinates produces: navigable terrain, rocks and obstacles
+N_PIXEL_SETS = 3
+
+#The world coordinates, distances and angles of one of the pixel sets of a frame,
+#sized for the number of pixels inside the range/angle windows
+class PixelSetBuffers():
+    def __init__(self, n_pixels):
+        self.world_xy = np.empty((n_pixels, 2), dtype=np.int_) #(x, y) world map cells
+        self.dist = np.empty(n_pixels, dtype=np.float64)
+        self.angles = np.empty(n_pixels, dtype=np.float64)
+        self.window_pixels = None #indices into the window tables of the set's pixels of the last frame
+
+#Reusable buffers for every per-frame intermediate of the fused perception path
+#(perception.classify_pixels and perception.get_world_coordinates),
+#sized once for the camera image and calibration, so that steady state perception allocates
+#next to nothing per frame. The arrays the perception functions return when given a workspace
+#are views into these buffers: they are only valid until the workspace is used for the next frame.
+class FrameWorkspace():
+    def __init__(self, img_shape=(160, 320), calibration=None):
+        img_h, img_w = img_shape[:2]
+        self.img_shape = (img_h, img_w)
+        #classify_pixels
+        self.gray = np.empty((img_h, img_w), dtype=np.uint8)
+        self.hsv = np.empty((img_h, img_w, 3), dtype=np.uint8)
+        self.bright = np.empty((img_h, img_w), dtype=bool)
+        self.rocks = np.empty((img_h, img_w), dtype=bool)
+        self.scratch = np.empty((img_h, img_w), dtype=bool)
+        self.labels = np.empty((img_h, img_w), dtype=np.uint8)
+
+        self.calibration = calibration
+        if calibration is not None:
+            #the calibration tables restricted to the top down pixels inside the terrain or rock
+            #windows, the only ones get_world_coordinates carries through to the map
+            window_index = np.flatnonzero(calibration.terrain_window | calibration.rock_window)
+            self.window_src_index = calibration.src_index[window_index]
+            self.window_rover_xy = calibration.rover_xy[window_index]
+            self.window_dist = calibration.dist[window_index]
+            self.window_angles = calibration.angles[window_index]
+            self.window_terrain = calibration.terrain_window[window_index]
+            self.window_rock = calibration.rock_window[window_index]
+
+            #gathered flags of the window pixels and the per set pixel masks
+            n_window = len(window_index)
+            self.flags = np.empty(n_window, dtype=np.uint8)
+            self.flag_bits = np.empty(n_window, dtype=np.uint8)
+            self.masks = np.empty((N_PIXEL_SETS, n_window), dtype=bool)
+
+            #pixel set outputs and the float32 rover/world coordinates of the world transform
+            self.pixel_sets = [PixelSetBuffers(n_window) for _ in range(N_PIXEL_SETS)]
+            self.rover_xy = np.empty((n_window, 2), dtype=np.float32)
+            self.world_scratch = np.empty((n_window, 2), dtype=np.float32)
+            self.transform = None #the world_transform.WorldTransform of the last frame
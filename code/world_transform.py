@@ -0,0 +1,33 @@
+import numpy as np
+import cv2
+
+#Rover centric to world map transform of one frame. The rotation by the yaw, the scaling and the
+#translation to the rover position are folded into a single float32 2x3 affine when the transform
+#is built (once per frame), so the yaw trig is not recomputed for every pixel set. apply() maps
+#(x, y) rover coordinates through it in one cv2.transform pass, then clips and truncates the
+#result into integer world map cells, optionally writing into reusable buffers.
+#
+#Compared to a float64 rotate/scale/translate chain, float32 only changes the cell of points
+#that lie within float32 rounding of a cell boundary (a few in 10000 pixels).
+class WorldTransform():
+    def __init__(self, xpos, ypos, yaw, scale, world_size):
+        yaw_rad = yaw * np.pi / 180
+        cos_yaw, sin_yaw = np.cos(yaw_rad), np.sin(yaw_rad)
+        self.affine = np.float32([[cos_yaw / scale, -sin_yaw / scale, xpos],
+                                  [sin_yaw / scale, cos_yaw / scale, ypos]])
+        self.world_size = world_size
+
+    #Map an (n, 2) array of rover (x, y) coordinates to an (n, 2) array of integer world (x, y)
+    #cells, clipped to the map. out (n, 2 integers) and scratch (n, 2 float32) are used instead
+    #of new arrays when given
+    def apply(self, rover_xy, out=None, scratch=None):
+        if out is None:
+            out = np.empty((len(rover_xy), 2), dtype=np.int_)
+        if len(rover_xy) == 0:
+            return out
+        rover_xy = np.ascontiguousarray(rover_xy, dtype=np.float32).reshape(-1, 1, 2)
+        world_xy = cv2.transform(rover_xy, self.affine, dst=None if scratch is None else scratch.reshape(-1, 1, 2))
+        #clipping before truncating toward zero gives the same cells as truncating first
+        np.clip(world_xy, 0, self.world_size - 1, out=world_xy)
+        np.copyto(out, world_xy.reshape(-1, 2), casting='unsafe')
+        return out